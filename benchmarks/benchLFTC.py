@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+
+# time the lftc hot paths on the bundled COBRApy models and larger synthetic
+# models, and write the results as JSON to track them across releases
+#
+# usage: python benchmarks/benchLFTC.py --output results.json
+#
+# runs offline, using only models bundled with COBRApy
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# import lftc from this checkout, whether or not it is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cobra
+import cobra.io
+import numpy as np
+import pandas as pd
+import lftc
+from lftc.exploreModel import \
+    findSubsetConnectedToFeed, \
+    findConsumedMetabolites, \
+    findProducingReactionsOutsideCore, \
+    findReversibleConsumingReactionsOutsideCore, \
+    findSubsetConnectedToFeedIndexed, \
+    findConsumedMetabolitesIndexed, \
+    findProducingReactionsOutsideCoreIndexed, \
+    findReversibleConsumingReactionsOutsideCoreIndexed, \
+    findRemovableReactionsIndexed
+from lftc.modelIndex import ModelIndex
+
+# glycolysis and the TCA cycle, with the glucose transporters of either model
+startCore = {'EX_glc__D_e', 'GLCpts', 'GLCtex_copy1', 'GLCptspp', 'PGI', 'PFK', 'FBA', 'TPI',
+             'GAPD', 'PGK', 'PGM', 'ENO', 'PYK', 'PDH', 'CS', 'ACONTa',
+             'ACONTb', 'ICDHyr', 'AKGDH', 'SUCOAS', 'SUCDi', 'FUM', 'MDH'}
+feed = 'EX_glc__D_e'
+
+def loadBundled(name):
+    # load a model bundled with COBRApy, growing on glucose
+    model = cobra.io.load_model(name)
+    model.reactions.get_by_id(feed).bounds = (-10, -10)
+    biomass = [r for r in model.reactions if r.objective_coefficient != 0]
+    model.optimize()
+    for reaction in biomass:
+        reaction.lower_bound = 0.5 * reaction.flux
+    return model
+
+def tileModel(model, copies):
+    # a larger model made of copies of a model, which share the extracellular
+    # and currency metabolites, so every copy is connected to the feed
+
+    tiled = model.copy()
+    shared = {m.id for m in model.metabolites
+              if m.compartment == 'e' or m.id in lftc.currencyMetabolites}
+    for copy in range(1, copies):
+        metabolites = {}
+        for metabolite in model.metabolites:
+            if metabolite.id in shared:
+                metabolites[metabolite.id] = tiled.metabolites.get_by_id(
+                    metabolite.id)
+            else:
+                metabolites[metabolite.id] = cobra.Metabolite(
+                    metabolite.id + '_' + str(copy),
+                    compartment=metabolite.compartment)
+        reactions = []
+        for reaction in model.reactions:
+            if reaction.boundary:
+                continue
+            newReaction = cobra.Reaction(
+                reaction.id + '_' + str(copy),
+                lower_bound=min(reaction.lower_bound, 0),
+                upper_bound=reaction.upper_bound)
+            newReaction.add_metabolites({
+                metabolites[m.id]: c for m, c in reaction.metabolites.items()})
+            reactions.append(newReaction)
+        tiled.add_reactions(reactions)
+    return tiled
+
+def getModel(name):
+    # the model to benchmark, its feed, core and currency metabolites
+    if name == 'textbook':
+        model = loadBundled('textbook')
+    elif name == 'ecoli':
+        model = loadBundled('iJO1366')
+    elif name.startswith('tiled'):
+        model = tileModel(loadBundled('textbook'), int(name[5:]))
+    elif name.startswith('synthetic'):
+        nReactions = int(name[9:])
+        return lftc.makeSyntheticModel(
+            nReactions, int(0.6 * nReactions), seed=1)
+    else:
+        raise ValueError('unknown model ' + name)
+    core = startCore.intersection(r.id for r in model.reactions)
+    return model, feed, core, lftc.currencyMetabolites
+
+def timeCalls(function, repeat):
+    # wall clock seconds of each call, and the peak memory allocated by
+    # python during one extra call
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peakMemory
+
+def _boundInTransaction(model, producingFluxes, consumingFluxes):
+    # apply lftc bounds in place, then roll them back
+
+    with lftc.modelTransaction(model):
+        lftc.setModelFluxes(
+            model, producingFluxes, consumingFluxes, copyModel=False)
+
+def benchModel(name, model, feed, core, currency, steps, repeat):
+    # run every benchmark on one model
+    exchanges = {r.id for r in model.exchanges}
+    fluxIntoCore, producingFluxes, consumingFluxes = \
+        lftc.limitFluxToCore(core, model, currency)
+    metabolites = findConsumedMetabolites(core, model, currency)
+
+    # the same searches on the sparse index used while annealing
+    index = ModelIndex.fromModel(model, currency)
+    coreMask = index.reactionMask(core)
+    feedIndex = index.reactionIndex[feed]
+    metaboliteMask = findConsumedMetabolitesIndexed(coreMask, index)
+
+    # the matrix backend keeps its engine between calls on a compact model
+    compactModel = lftc.CompactModel.fromModel(model, currency)
+    lftc.limitFluxToCore(core, compactModel, currency)
+
+    def makeProblem():
+        return lftc.OptimalCoreProblem(
+            state=set(core),
+            model=model,
+            feed=feed,
+            currencyMetabolites=currency,
+            minOverlapWithStart=1.0,
+            maxOverlapWithModel=0.6,
+            excludeReactions=exchanges,
+            )
+
+    # each timed anneal starts from a problem built beforehand, so that
+    # building it (a model copy, the index and the first solve) is timed
+    # on its own
+    problems = []
+
+    def annealSteps():
+        ocp = problems.pop()
+        ocp.set_schedule(
+            {'steps': steps, 'tmax': 50, 'tmin': 0.01, 'updates': 0})
+        ocp.anneal(seed=1)
+
+    benchmarks = [
+        ('limitFluxToCore', lambda: lftc.limitFluxToCore(
+            core, model, currency)),
+        ('limitFluxToCoreMatrix', lambda: lftc.limitFluxToCore(
+            core, compactModel, currency)),
+        ('setModelFluxes', lambda: lftc.setModelFluxes(
+            model, producingFluxes, consumingFluxes)),
+        ('setModelFluxesTransaction', lambda: _boundInTransaction(
+            model, producingFluxes, consumingFluxes)),
+        ('findSubsetConnectedToFeed', lambda: findSubsetConnectedToFeed(
+            core, feed, currency, model)),
+        ('findConsumedMetabolites', lambda: findConsumedMetabolites(
+            core, model, currency)),
+        ('findProducingReactionsOutsideCore',
+            lambda: findProducingReactionsOutsideCore(metabolites, model, core)),
+        ('findReversibleConsumingReactionsOutsideCore',
+            lambda: findReversibleConsumingReactionsOutsideCore(
+                metabolites, model, core)),
+        ('findSubsetConnectedToFeedIndexed',
+            lambda: findSubsetConnectedToFeedIndexed(
+                coreMask, feedIndex, index)),
+        ('findConsumedMetabolitesIndexed',
+            lambda: findConsumedMetabolitesIndexed(coreMask, index)),
+        ('findProducingReactionsOutsideCoreIndexed',
+            lambda: findProducingReactionsOutsideCoreIndexed(
+                metaboliteMask, index, coreMask)),
+        ('findReversibleConsumingReactionsOutsideCoreIndexed',
+            lambda: findReversibleConsumingReactionsOutsideCoreIndexed(
+                metaboliteMask, index, coreMask)),
+        ('findRemovableReactionsIndexed',
+            lambda: findRemovableReactionsIndexed(coreMask, feedIndex, index)),
+        ('makeProblem', makeProblem),
+        ('anneal', annealSteps),
+        ]
+
+    results = []
+    for benchmark, function in benchmarks:
+        if benchmark == 'anneal':
+            problems.extend(makeProblem() for _ in range(repeat + 1))
+        seconds, peakMemory = timeCalls(function, repeat)
+        result = {
+            'model': name,
+            'reactions': len(model.reactions),
+            'metabolites': len(model.metabolites),
+            'coreSize': len(core),
+            'benchmark': benchmark,
+            'repeat': repeat,
+            'seconds': seconds,
+            'minSeconds': min(seconds),
+            'medianSeconds': float(np.median(seconds)),
+            'peakMemoryBytes': peakMemory,
+            }
+        if benchmark == 'anneal':
+            result['steps'] = steps
+            result['stepsPerSecond'] = steps / min(seconds)
+        results.append(result)
+        print('%-12s %-52s %10.4fs %12d bytes' % (
+            name, benchmark, min(seconds), peakMemory), file=sys.stderr)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the lftc hot paths')
+    parser.add_argument('--models',
+        default='textbook,ecoli,tiled10,synthetic5000',
+        help='comma separated models: textbook, ecoli (iJO1366), tiledN '
+             '(N copies of textbook) or syntheticN (a synthetic model with '
+             'N reactions from lftc.makeSyntheticModel)')
+    parser.add_argument('--steps', type=int, default=200,
+        help='annealing steps to time')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='timed calls of each benchmark')
+    parser.add_argument('--output', default='-',
+        help='JSON file to write, or - for stdout')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.models.split(','):
+        model, modelFeed, core, currency = getModel(name)
+        results.extend(benchModel(
+            name, model, modelFeed, core, currency, args.steps, args.repeat))
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'versions': {'cobra': cobra.__version__, 'numpy': np.__version__,
+                     'pandas': pd.__version__},
+        'solver': cobra.Configuration().solver.__name__,
+        'results': results,
+        }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == '__main__':
+    main()
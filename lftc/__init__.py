@@ -4,3 +4,7 @@ __version__ = '1.0'
 
 
 from .lftc import *
+from .parallel import annealChains, iterLimitFluxToCore, limitFluxToCoreBatch, \
+    localSearch, pruneBatch, estimateSchedule, limitFluxToCoreSweep
+from .engine import SweepResult
+from .synthetic import makeSyntheticModel
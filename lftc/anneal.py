@@ -22,9 +22,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 import abc
+import collections
 import copy
 import datetime
 import math
+import os
 import pickle
 import numpy as np
 import signal
@@ -45,6 +47,22 @@ def time_string(seconds):
     return '%4i:%02i:%02i' % (h, m, s)
 
 
+# progress of anneal_iter(), emitted every few steps
+AnnealSnapshot = collections.namedtuple('AnnealSnapshot', [
+    'step',             # steps done, 0 for the initial state
+    'T',                # temperature of the last step
+    'energy',           # energy of the current state
+    'proposed_energy',  # energy proposed by the last step
+    'accepted',         # whether the last step was accepted
+    'best_energy',      # best energy found so far
+    'acceptance',       # fraction of steps since the last snapshot accepted
+    'improvement',      # fraction of steps since the last snapshot improving
+    'elapsed',          # seconds since the start of annealing
+    'diff',             # state_diff() from the last snapshot's state
+    'stop_reason',      # why annealing stopped, in the final snapshot only
+    ])
+
+
 class Annealer(object):
 
     """Performs simulated annealing by calling functions to calculate
@@ -62,11 +80,24 @@ class Annealer(object):
     copy_strategy = 'deepcopy'
     user_exit = False
     save_state_on_exit = False
+    checkpoint_file = None
+    checkpoint_steps = 0
+    checkpoint_seconds = 0.0
+    patience_steps = 0
+    patience_seconds = 0.0
+    target_energy = None
+    min_acceptance = 0.0
+    acceptance_window = 1000
+
+    # decimals energies are rounded to before they are compared, so that
+    # solver noise cannot change the trajectory, or None to compare exactly
+    energy_decimals = None
 
     # placeholders
     best_state = None
     best_energy = None
     start = None
+    stop_reason = None
 
     def __init__(self, initial_state=None, load_state=None):
         if initial_state is not None:
@@ -92,6 +123,103 @@ class Annealer(object):
         with open(fname, 'rb') as fh:
             self.state = pickle.load(fh)
 
+    def set_checkpoint(self, fname, steps=0, seconds=0.0):
+        """Periodically checkpoint anneal() to fname
+
+        A checkpoint is written every `steps` steps and/or every `seconds`
+        seconds, whichever comes first, and when anneal() stops early on
+        user exit. Pass the file to anneal(resume=fname) to continue.
+        """
+        self.checkpoint_file = fname
+        self.checkpoint_steps = int(steps)
+        self.checkpoint_seconds = float(seconds)
+
+    def set_stopping(self, patience_steps=0, patience_seconds=0.0,
+                     target_energy=None, min_acceptance=0.0,
+                     acceptance_window=1000):
+        """Stop anneal() before all steps are done once it has converged
+
+        Annealing stops when any criterion is met:
+
+        * patience_steps: no new best energy within this many steps
+        * patience_seconds: no new best energy within this many seconds
+        * target_energy: the best energy is at or below this energy
+        * min_acceptance: fewer than this fraction of the last
+          acceptance_window steps were accepted
+
+        Zero or None disables a criterion, and all are disabled by default.
+        The reason annealing stopped is stored in stop_reason, which is
+        one of 'steps', 'user_exit', 'closed', 'patience_steps',
+        'patience_seconds', 'target_energy' or 'min_acceptance'. Stopping
+        early is a finished run, so no checkpoint is written for it.
+        """
+        self.patience_steps = int(patience_steps)
+        self.patience_seconds = float(patience_seconds)
+        self.target_energy = target_energy
+        self.min_acceptance = float(min_acceptance)
+        self.acceptance_window = int(acceptance_window)
+
+    def energy_key(self, E):
+        """Returns an energy as compared by the Metropolis criterion and
+        best state tracking, rounded to energy_decimals if set"""
+        if self.energy_decimals is None:
+            return E
+        return round(E, self.energy_decimals)
+
+    def pack_state(self, state):
+        """Returns a compact picklable copy of a state for checkpoints"""
+        return self.copy_state(state)
+
+    def unpack_state(self, packed):
+        """Returns the state stored by pack_state"""
+        return self.copy_state(packed)
+
+    def fingerprint(self):
+        """Returns a value identifying the problem, stored in checkpoints
+        and compared on resume, so a checkpoint can only continue the
+        problem it was written for. Returns None by default."""
+        return None
+
+    def save_checkpoint(self, fname, context):
+        """Atomically pickles the annealing context and RNG state
+
+        context holds the step, prev_energy, trials, accepts and
+        improves counters, the last_improvement step and its
+        last_improvement_elapsed time, and the acceptance_window of the
+        loop, at the end of a step when the current state is the one kept
+        by the Metropolis criterion.
+        """
+        checkpoint = dict(context)
+        checkpoint['fingerprint'] = self.fingerprint()
+        checkpoint['state'] = self.pack_state(self.state)
+        checkpoint['best_state'] = self.pack_state(self.best_state)
+        checkpoint['best_energy'] = self.best_energy
+        checkpoint['schedule'] = {'tmax': self.Tmax, 'tmin': self.Tmin,
+                                  'steps': self.steps, 'updates': self.updates}
+        checkpoint['elapsed'] = time.time() - self.start
+        checkpoint['rng'] = np.random.get_state()
+        tmp = fname + '.tmp'
+        with open(tmp, 'wb') as fh:
+            pickle.dump(checkpoint, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, fname)
+
+    def load_checkpoint(self, fname):
+        """Loads a checkpoint written by save_checkpoint, restoring the
+        schedule, states, best state and RNG state, and returns the
+        context of the annealing loop"""
+        with open(fname, 'rb') as fh:
+            checkpoint = pickle.load(fh)
+        assert checkpoint.get('fingerprint') == self.fingerprint(), \
+            'checkpoint was written for a different problem'
+        self.set_schedule(checkpoint['schedule'])
+        self.state = self.unpack_state(checkpoint['state'])
+        self.best_state = self.unpack_state(checkpoint['best_state'])
+        self.best_energy = checkpoint['best_energy']
+        np.random.set_state(checkpoint['rng'])
+        return checkpoint
+
     @abc.abstractmethod
     def move(self):
         """Create a state change"""
@@ -143,6 +271,22 @@ class Annealer(object):
         """
         self.default_update(*args, **kwargs)
 
+    def record_step(self, step, T, proposed_E, E, accepted):
+        """Called after every step of anneal() with values it already has.
+
+        proposed_E is the energy of the state after the move, and E the
+        energy of the state kept by the Metropolis criterion. Step 0 is the
+        initial state. Override to record a trace, does nothing by default.
+        """
+        pass
+
+    def state_diff(self, previous, current):
+        """Returns a lightweight description of how the current state
+        differs from a previous state, for anneal_iter() snapshots. Returns
+        None by default.
+        """
+        return None
+
     def default_update(self, step, T, E, acceptance, improvement):
         """Default update, outputs to stderr.
 
@@ -178,18 +322,45 @@ class Annealer(object):
                    time_string(elapsed), time_string(remain)), file=sys.stderr, end="\r")
             sys.stderr.flush()
 
-    def anneal(self, seed=None):
+    def anneal(self, seed=None, resume=None):
         """Minimizes the energy of a system by simulated annealing.
 
         Parameters
         state : an initial arrangement of the system
+        seed : optional random seed
+        resume : optional checkpoint file from set_checkpoint to continue
+            from, following the same trajectory as an uninterrupted run
 
         Returns
-        (state, energy): the best state and energy found.
+        (state, energy): the best state and energy found. Why annealing
+            stopped is stored in stop_reason, see set_stopping.
+        """
+        for snapshot in self.anneal_iter(seed, resume, every=None):
+            pass
+        return self.best_state, self.best_energy
+
+    def anneal_iter(self, seed=None, resume=None, every=1):
+        """Runs anneal() as a generator of progress snapshots.
+
+        Yields an AnnealSnapshot for the initial state, after every
+        `every` steps, and after the last step, following the same
+        trajectory as anneal() for the same seed. Stop early by breaking
+        out of the loop or closing the generator, which is handled like a
+        user exit, including writing a checkpoint if one is set. When the
+        generator finishes, best_state and best_energy hold the result,
+        and the state is set to the best state as by anneal().
+
+        Parameters
+        seed : optional random seed
+        resume : optional checkpoint file to continue from, as for anneal()
+        every : steps between snapshots, or None for only the final one
         """
         step = 0
         self.start = time.time()
-        if seed:
+        if resume:
+            context = self.load_checkpoint(resume)
+            self.start -= context['elapsed']
+        elif seed:
             # set random seed
             np.random.seed(seed)
 
@@ -198,53 +369,167 @@ class Annealer(object):
             raise Exception('Exponential cooling requires a minimum "\
                 "temperature greater than zero.')
         Tfactor = -math.log(self.Tmax / self.Tmin)
-
-        # Note initial state
-        T = self.Tmax
-        E = self.energy()
-        prevState = self.copy_state(self.state)
-        prevEnergy = E
-        self.best_state = self.copy_state(self.state)
-        self.best_energy = E
-        trials, accepts, improves = 0, 0, 0
         if self.updates > 0:
             updateWavelength = self.steps / self.updates
-            self.update(step, T, E, None, None)
 
-        # Attempt moves to new states
-        while step < self.steps and not self.user_exit:
-            step += 1
+        if resume:
+            # Continue from the checkpointed loop
+            step = context['step']
             T = self.Tmax * math.exp(Tfactor * step / self.steps)
-            self.move()
+            prevState = self.copy_state(self.state)
+            prevEnergy = context['prev_energy']
+            trials = context['trials']
+            accepts = context['accepts']
+            improves = context['improves']
+            lastImprovement = context['last_improvement']
+            lastImprovementTime = self.start + \
+                context['last_improvement_elapsed']
+            E = prevEnergy
+        else:
+            # Note initial state
+            T = self.Tmax
             E = self.energy()
-            dE = E - prevEnergy
-            trials += 1
-            if dE > 0.0 and math.exp(-dE / T) < np.random.random():
-                # Restore previous state
-                self.state = self.copy_state(prevState)
-                E = prevEnergy
-            else:
-                # Accept new state and compare to best state
-                accepts += 1
-                if dE < 0.0:
-                    improves += 1
-                prevState = self.copy_state(self.state)
-                prevEnergy = E
-                if E < self.best_energy:
-                    self.best_state = self.copy_state(self.state)
-                    self.best_energy = E
-            if self.updates > 1:
-                if (step // updateWavelength) > ((step - 1) // updateWavelength):
-                    self.update(
-                        step, T, E, accepts / trials, improves / trials)
-                    trials, accepts, improves = 0, 0, 0
+            prevState = self.copy_state(self.state)
+            prevEnergy = E
+            self.best_state = self.copy_state(self.state)
+            self.best_energy = E
+            trials, accepts, improves = 0, 0, 0
+            lastImprovement = step
+            lastImprovementTime = time.time()
+            self.record_step(step, T, E, E, True)
+            if self.updates > 0:
+                self.update(step, T, E, None, None)
+        lastCheckpoint = (step, time.time())
+
+        # acceptance of the most recent steps, which with the step and time
+        # of the last new best energy decides when to stop once converged
+        window = collections.deque(
+            context['acceptance_window'] if resume else (),
+            maxlen=max(self.acceptance_window, 1))
+        self.stop_reason = None
+
+        def checkpointContext():
+            return {
+                'step': step, 'prev_energy': prevEnergy, 'trials': trials,
+                'accepts': accepts, 'improves': improves,
+                'last_improvement': lastImprovement,
+                'last_improvement_elapsed': lastImprovementTime - self.start,
+                'acceptance_window': list(window)}
+
+        def converged():
+            if self.target_energy is not None and \
+                self.best_energy <= self.target_energy:
+                return 'target_energy'
+            if self.patience_steps and \
+                step - lastImprovement >= self.patience_steps:
+                return 'patience_steps'
+            if self.patience_seconds and \
+                time.time() - lastImprovementTime >= self.patience_seconds:
+                return 'patience_seconds'
+            if self.min_acceptance and len(window) == window.maxlen and \
+                sum(window) < self.min_acceptance * len(window):
+                return 'min_acceptance'
+            return None
+
+        # counters and state at the last snapshot
+        snapshotStep = step
+        snapshotAccepts, snapshotImproves = 0, 0
+        snapshotState = self.copy_state(self.state)
+        proposed_E, accepted = E, True
+
+        def snapshot():
+            trials = step - snapshotStep
+            return AnnealSnapshot(
+                step, T, E, proposed_E, accepted, self.best_energy,
+                snapshotAccepts / trials if trials else None,
+                snapshotImproves / trials if trials else None,
+                time.time() - self.start,
+                self.state_diff(snapshotState, self.state),
+                self.stop_reason,
+                )
+
+        closed = False
+        try:
+            if every:
+                yield snapshot()
+
+            # Attempt moves to new states
+            self.stop_reason = converged()
+            while step < self.steps and not self.user_exit and \
+                not self.stop_reason:
+                step += 1
+                T = self.Tmax * math.exp(Tfactor * step / self.steps)
+                self.move()
+                trials += 1
+                E = self.energy()
+                proposed_E = E
+                dE = self.energy_key(E) - self.energy_key(prevEnergy)
+                rejected = dE > 0.0 and \
+                    math.exp(-dE / T) < np.random.random()
+                accepted = not rejected
+                window.append(accepted)
+                if rejected:
+                    # Restore previous state
+                    self.state = self.copy_state(prevState)
+                    E = prevEnergy
+                    self.record_step(step, T, proposed_E, E, False)
+                else:
+                    # Accept new state and compare to best state
+                    self.record_step(step, T, proposed_E, E, True)
+                    accepts += 1
+                    snapshotAccepts += 1
+                    if dE < 0.0:
+                        improves += 1
+                        snapshotImproves += 1
+                    prevState = self.copy_state(self.state)
+                    prevEnergy = E
+                    if self.energy_key(E) < \
+                        self.energy_key(self.best_energy):
+                        self.best_state = self.copy_state(self.state)
+                        self.best_energy = E
+                        lastImprovement = step
+                        lastImprovementTime = time.time()
+                if self.updates > 1:
+                    if (step // updateWavelength) > \
+                        ((step - 1) // updateWavelength):
+                        self.update(
+                            step, T, E, accepts / trials, improves / trials)
+                        trials, accepts, improves = 0, 0, 0
+                if self.checkpoint_file and (
+                    (self.checkpoint_steps and
+                     step - lastCheckpoint[0] >= self.checkpoint_steps) or
+                    (self.checkpoint_seconds and
+                     time.time() - lastCheckpoint[1] >=
+                     self.checkpoint_seconds)):
+                    self.save_checkpoint(
+                        self.checkpoint_file, checkpointContext())
+                    lastCheckpoint = (step, time.time())
+                if step < self.steps:
+                    self.stop_reason = converged()
+                if every and step % every == 0 and step < self.steps and \
+                    not self.stop_reason:
+                    yield snapshot()
+                    snapshotStep = step
+                    snapshotAccepts, snapshotImproves = 0, 0
+                    snapshotState = self.copy_state(self.state)
+        except GeneratorExit:
+            # closed by the caller, handled like a user exit
+            closed = True
+
+        if closed:
+            self.stop_reason = 'closed'
+        elif self.stop_reason is None:
+            self.stop_reason = 'steps' if step >= self.steps else 'user_exit'
+        final = snapshot()
+        if self.checkpoint_file and (closed or self.user_exit) and \
+            step < self.steps:
+            self.save_checkpoint(self.checkpoint_file, checkpointContext())
 
         self.state = self.copy_state(self.best_state)
         if self.save_state_on_exit:
             self.save_state()
-
-        # Return best state and energy
-        return self.best_state, self.best_energy
+        if not closed and (not every or step != snapshotStep):
+            yield final
 
     def auto(self, minutes, steps=2000, seed=None):
         """Explores the annealing landscape and 
@@ -267,7 +552,7 @@ class Annealer(object):
             for _ in range(steps):
                 self.move()
                 E = self.energy()
-                dE = E - prevEnergy
+                dE = self.energy_key(E) - self.energy_key(prevEnergy)
                 if dE > 0.0 and math.exp(-dE / T) < np.random.random():
                     self.state = self.copy_state(prevState)
                     E = prevEnergy
@@ -0,0 +1,185 @@
+"""
+Incrementally maintained boundary of a core, for cores which change by a
+few reactions at a time
+
+By Tyler W. H. Backman
+"""
+
+import copy
+import numpy as np
+
+
+class BoundaryTracker(object):
+
+    def __init__(self, index):
+        """Reference counted boundary reaction sets of a core.
+
+        Tracks the same sets as findConsumedMetabolitesIndexed,
+        findProducingReactionsOutsideCoreIndexed and
+        findReversibleConsumingReactionsOutsideCoreIndexed, but updates them
+        as single reactions enter or leave the core, in time proportional
+        to the number of metabolites and reactions adjacent to the changed
+        reaction.
+
+        Each metabolite counts the core reactions which consume it, and each
+        reaction counts the consumed metabolites it produces or consumes.
+        The core starts out empty.
+
+        Args:
+            index (lftc.modelIndex.ModelIndex): The index of the model.
+        """
+        self.index = index
+        nReactions = len(index.reactionIds)
+        nMetabolites = len(index.metaboliteIds)
+        self.core = np.zeros(nReactions, dtype=bool)
+        self.metaboliteCount = np.zeros(nMetabolites, dtype=np.int64)
+        self.producingCount = np.zeros(nReactions, dtype=np.int64)
+        self.consumingCount = np.zeros(nReactions, dtype=np.int64)
+
+        # current bool masks of the boundary
+        self.consumedMetabolites = np.zeros(nMetabolites, dtype=bool)
+        self.producing = np.zeros(nReactions, dtype=bool)
+        self.consuming = np.zeros(nReactions, dtype=bool)
+
+        # boundary membership of reactions changed since the last diff(),
+        # as they were at the last diff()
+        self._producingBefore = {}
+        self._consumingBefore = {}
+
+    def _row(self, matrix, i):
+        return matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]
+
+    def _consumedBy(self, reactionIndex):
+        # non-currency metabolites which a reaction can consume
+        index = self.index
+        metabolites = self._row(index.reactants, reactionIndex)
+        if index.reversible[reactionIndex]:
+            metabolites = np.concatenate(
+                (metabolites, self._row(index.products, reactionIndex)))
+        return metabolites[~index.currency[metabolites]]
+
+    def _setProducing(self, reactions, value):
+        for r in reactions:
+            self._producingBefore.setdefault(r, self.producing[r])
+        self.producing[reactions] = value
+
+    def _setConsuming(self, reactions, value):
+        for r in reactions:
+            self._consumingBefore.setdefault(r, self.consuming[r])
+        self.consuming[reactions] = value
+
+    def _count(self, counts, reactions, step):
+        # add step to the count of each reaction, and return those
+        # which changed between zero and non-zero
+        reactions, multiplicity = np.unique(reactions, return_counts=True)
+        before = counts[reactions]
+        counts[reactions] += step * multiplicity
+        if step > 0:
+            return reactions[before == 0]
+        return reactions[counts[reactions] == 0]
+
+    def _updateMetabolites(self, metabolites, step):
+        index = self.index
+        self.metaboliteCount[metabolites] += step
+        if step > 0:
+            changed = metabolites[self.metaboliteCount[metabolites] == 1]
+        else:
+            changed = metabolites[self.metaboliteCount[metabolites] == 0]
+        if len(changed) == 0:
+            return
+        self.consumedMetabolites[changed] = step > 0
+
+        producers = np.concatenate(
+            [self._row(index.productsT, m) for m in changed])
+        producers = self._count(self.producingCount, producers, step)
+        producers = producers[~self.core[producers]]
+        self._setProducing(producers, step > 0)
+
+        consumers = np.concatenate(
+            [self._row(index.reactantsT, m) for m in changed])
+        consumers = self._count(self.consumingCount, consumers, step)
+        consumers = consumers[~self.core[consumers] & index.reversible[consumers]]
+        self._setConsuming(consumers, step > 0)
+
+    def add(self, reactionIndex):
+        """Add a reaction to the core by its position in the index."""
+        if self.core[reactionIndex]:
+            return
+        self.core[reactionIndex] = True
+        self._setProducing([reactionIndex], False)
+        self._setConsuming([reactionIndex], False)
+        self._updateMetabolites(np.unique(self._consumedBy(reactionIndex)), 1)
+
+    def remove(self, reactionIndex):
+        """Remove a reaction from the core by its position in the index."""
+        if not self.core[reactionIndex]:
+            return
+        self.core[reactionIndex] = False
+        self._updateMetabolites(np.unique(self._consumedBy(reactionIndex)), -1)
+        self._setProducing([reactionIndex], self.producingCount[reactionIndex] > 0)
+        self._setConsuming([reactionIndex], self.consumingCount[reactionIndex] > 0
+            and self.index.reversible[reactionIndex])
+
+    def update(self, coreMask):
+        """Move the tracked core to coreMask, one changed reaction at a time."""
+        changed = np.flatnonzero(coreMask != self.core)
+        for reactionIndex in changed:
+            if coreMask[reactionIndex]:
+                self.add(reactionIndex)
+            else:
+                self.remove(reactionIndex)
+
+    def setReversible(self, reactionIndices, reversible):
+        """Change the reversibility of reactions, keeping the core.
+
+        Which reactions can consume metabolites from the core depends on
+        reversibility, so the core is emptied and refilled under a copy of
+        the index with the new reversibility. The changes appear in the
+        next diff() as usual. The original index is never modified.
+
+        Args:
+            reactionIndices (numpy.ndarray): Positions of the reactions in
+                the index.
+            reversible (numpy.ndarray): Whether each reaction is reversible.
+
+        Returns:
+            index (lftc.modelIndex.ModelIndex): The index now tracked, which
+                is the same object if no reversibility changed.
+        """
+        reversible = np.asarray(reversible, dtype=bool)
+        if np.array_equal(self.index.reversible[reactionIndices], reversible):
+            return self.index
+        index = copy.copy(self.index)
+        index.reversible = np.array(index.reversible, dtype=bool)
+        index.reversible[reactionIndices] = reversible
+        core = self.core.copy()
+        self.update(np.zeros_like(core))
+        self.index = index
+        self.update(core)
+        return index
+
+    def diff(self):
+        """Returns and resets the boundary changes since the last call.
+
+        Returns:
+            (tuple): tuple containing:
+                arg1 (list): Reaction indices which started producing
+                    metabolites in the core.
+                arg2 (list): Reaction indices which stopped producing
+                    metabolites in the core.
+                arg3 (list): Reversible reaction indices which started
+                    consuming metabolites from the core.
+                arg4 (list): Reversible reaction indices which stopped
+                    consuming metabolites from the core.
+        """
+        addedProducing = [r for r, before in self._producingBefore.items()
+            if self.producing[r] and not before]
+        removedProducing = [r for r, before in self._producingBefore.items()
+            if before and not self.producing[r]]
+        addedConsuming = [r for r, before in self._consumingBefore.items()
+            if self.consuming[r] and not before]
+        removedConsuming = [r for r, before in self._consumingBefore.items()
+            if before and not self.consuming[r]]
+        self._producingBefore = {}
+        self._consumingBefore = {}
+        return addedProducing, removedProducing, addedConsuming, removedConsuming
@@ -0,0 +1,254 @@
+"""
+Caches for core scores, so that a core never needs to be solved twice
+
+By Tyler W. H. Backman
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+import numpy as np
+from .engine import CoreFluxResult
+from .fingerprint import fingerprint, indexFingerprint
+
+
+class CoreEnergyCache(object):
+
+    def __init__(self, maxBytes=64 * 2 ** 20):
+        """Bounded least recently used cache of limit flux to core results.
+
+        Results are keyed on the identity of the core, so a core is only
+        found again if exactly the same set of reactions is scored. Once
+        the approximate memory used by cached entries exceeds maxBytes, the
+        least recently used entries are evicted.
+
+        Args:
+            maxBytes (int): The approximate maximum size of the cache in
+                bytes. A value of 0 disables caching.
+        """
+        assert maxBytes >= 0, 'maxBytes must not be negative'
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, coreReactionNames):
+        """Returns a hashable identity for a core, a set or CoreState."""
+        if hasattr(coreReactionNames, 'key'):
+            return coreReactionNames.key()
+        return frozenset(coreReactionNames)
+
+    def get(self, key):
+        """Returns the cached result for a key from key(), or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, result):
+        """Stores a lftc.CoreFluxResult, or a tuple as from limitFluxToCore."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        size = sys.getsizeof(key) + sys.getsizeof(result)
+        if hasattr(result, 'nbytes'):
+            size += result.nbytes
+        else:
+            for value in result:
+                if hasattr(value, 'memory_usage'):
+                    size += value.memory_usage(index=True)
+                else:
+                    size += sys.getsizeof(value)
+        if size > self.maxBytes:
+            return
+        self._entries[key] = (result, size)
+        self.currentBytes += size
+        while self.currentBytes > self.maxBytes:
+            _, (_, evictedSize) = self._entries.popitem(last=False)
+            self.currentBytes -= evictedSize
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all entries, but keeps the hit and miss counters."""
+        self._entries.clear()
+        self.currentBytes = 0
+
+    def info(self):
+        """Returns a dict of cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.currentBytes,
+            'maxBytes': self.maxBytes,
+            }
+
+
+class DiskResultCache(object):
+
+    def __init__(self, path, maxBytes=2 ** 30, timeout=60.0):
+        """Persistent cache of limit flux to core results in SQLite.
+
+        Results are keyed on a hash of the model stoichiometry, reaction
+        bounds and currency metabolites, and of the core, so they are found
+        again by later runs and other processes using an identical model.
+        Once the stored results exceed maxBytes, the least recently used
+        are deleted. The database is opened in write ahead log mode, so
+        many processes can read and write it at once, and each process
+        opens its own connection, so the cache can be sent to workers.
+
+        Args:
+            path (str): The SQLite database file, created if missing.
+            maxBytes (int): Optional, the approximate maximum size of the
+                stored results in bytes.
+            timeout (float): Optional, seconds to wait for another process
+                holding a write lock.
+        """
+        assert maxBytes >= 0, 'maxBytes must not be negative'
+        self.path = path
+        self.maxBytes = maxBytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_connection'] = None
+        state['_pid'] = None
+        return state
+
+    def _connect(self):
+        # one connection per process, as sqlite connections can't be shared
+        # across a fork
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                fluxIntoCore REAL,
+                producingIndices BLOB,
+                producingValues BLOB,
+                consumingIndices BLOB,
+                consumingValues BLOB,
+                bytes INTEGER,
+                accessed REAL)""")
+            connection.execute("""CREATE INDEX IF NOT EXISTS resultsAccessed
+                ON results (accessed)""")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def key(self, index, bounds, coreReactionNames):
+        """Returns the key of a core of a model.
+
+        Args:
+            index (lftc.modelIndex.ModelIndex): The index of the model,
+                including its currency metabolites.
+            bounds (numpy.ndarray): The lower and upper bound of each
+                reaction, with one row per reaction.
+            coreReactionNames (set): The reaction names of type str in the
+                core, or a lftc.CoreState.
+        """
+        return fingerprint(
+            indexFingerprint(index, bounds),
+            np.packbits(index.reactionMask(coreReactionNames)),
+            )
+
+    def get(self, key, reactionIds):
+        """Returns the lftc.CoreFluxResult stored for a key, or None.
+
+        Args:
+            key (str): The key from key().
+            reactionIds (list): All reaction names of type str in the model.
+        """
+        connection = self._connect()
+        row = connection.execute("""SELECT fluxIntoCore, producingIndices,
+            producingValues, consumingIndices, consumingValues
+            FROM results WHERE key = ?""", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        connection.execute('UPDATE results SET accessed = ? WHERE key = ?',
+            (time.time(), key))
+        return CoreFluxResult(
+            np.float64(row[0]),
+            reactionIds,
+            np.frombuffer(row[1], dtype=np.int64),
+            np.frombuffer(row[2], dtype=float),
+            np.frombuffer(row[3], dtype=np.int64),
+            np.frombuffer(row[4], dtype=float),
+            )
+
+    def put(self, key, result):
+        """Stores a lftc.CoreFluxResult, evicting old results if needed."""
+        arrays = [
+            np.asarray(result.producingIndices, dtype=np.int64).tobytes(),
+            np.asarray(result.producingValues, dtype=float).tobytes(),
+            np.asarray(result.consumingIndices, dtype=np.int64).tobytes(),
+            np.asarray(result.consumingValues, dtype=float).tobytes(),
+            ]
+        size = len(key) + sum(len(a) for a in arrays) + 64
+        if size > self.maxBytes:
+            return
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [key, float(result.fluxIntoCore)] + arrays + [size, time.time()])
+            total = connection.execute(
+                'SELECT SUM(bytes) FROM results').fetchone()[0]
+            if total > self.maxBytes:
+                self._evict(connection, total - self.maxBytes)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self, connection, excessBytes):
+        # delete the least recently used results totalling excessBytes
+        evicted = 0
+        keys = []
+        for key, size in connection.execute(
+            'SELECT key, bytes FROM results ORDER BY accessed'):
+            if evicted >= excessBytes:
+                break
+            keys.append((key,))
+            evicted += size
+        connection.executemany('DELETE FROM results WHERE key = ?', keys)
+
+    def clear(self):
+        """Removes all stored results."""
+        self._connect().execute('DELETE FROM results')
+
+    def info(self):
+        """Returns a dict of cache statistics for this process."""
+        entries, stored = self._connect().execute(
+            'SELECT COUNT(*), SUM(bytes) FROM results').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': stored or 0,
+            'maxBytes': self.maxBytes,
+            }
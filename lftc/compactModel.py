@@ -0,0 +1,162 @@
+"""
+Preprocessed on-disk models, which lftc workers can load in milliseconds
+and score cores with, without constructing COBRApy objects
+
+By Tyler W. H. Backman
+"""
+
+import json
+import os
+import numpy as np
+from .modelIndex import ModelIndex
+
+
+class CompactModel(object):
+
+    # version of the directory layout written by save()
+    formatVersion = 1
+
+    def __init__(self, index, bounds, currencyMetabolites, path=None):
+        """Genome scale model reduced to what lftc needs to score cores.
+
+        Holds the sparse index of a model, including its precomputed
+        reaction-metabolite adjacency, and the bounds of its reactions.
+        It can be scored by limitFluxToCore() and OptimalCoreProblem with
+        the matrix backend, which only use the mass balance and reaction
+        bounds of a model. A compact model is never modified, so copies
+        share it, and limitFluxToCore() keeps one matrix engine per set of
+        currency metabolites to reuse between calls.
+
+        A model loaded with load() is sent to worker processes as its path,
+        so each worker maps the same files instead of receiving a copy.
+
+        Args:
+            index (lftc.modelIndex.ModelIndex): The index of the model.
+            bounds (numpy.ndarray): The lower and upper bound of each
+                reaction, with one row per reaction in index order.
+            currencyMetabolites (set): The currency metabolite names of type
+                str marked in index.
+            path (str): Optional, the directory the model was loaded from.
+        """
+        assert len(bounds) == len(index.reactionIds)
+        self.index = index
+        self.bounds = bounds
+        self.currencyMetabolites = frozenset(currencyMetabolites)
+        self.path = path
+        self._indices = {self.currencyMetabolites: index}
+        self._engines = {}
+
+    @classmethod
+    def fromModel(cls, model, currencyMetabolites):
+        """Build a compact model from a COBRApy model.
+
+        Args:
+            model (cobra.core.model.Model): A COBRApy genome scale model.
+            currencyMetabolites (set): The currency metabolite names of type
+                str to precompute the adjacency for.
+        """
+        return cls(
+            ModelIndex.fromModel(model, currencyMetabolites),
+            np.array([r.bounds for r in model.reactions], dtype=float),
+            currencyMetabolites,
+            )
+
+    def save(self, path):
+        """Write the model to a directory."""
+        self.index.save(path)
+        np.save(os.path.join(path, 'bounds.npy'), self.bounds)
+        with open(os.path.join(path, 'compactModel.json'), 'w') as f:
+            json.dump({
+                'formatVersion': self.formatVersion,
+                'currencyMetabolites': sorted(self.currencyMetabolites),
+                }, f)
+
+    @classmethod
+    def load(cls, path, mmapMode='r'):
+        """Read a model written by save().
+
+        Args:
+            path (str): The directory written by save().
+            mmapMode (str): Optional, the numpy mmap_mode of the arrays, as
+                for ModelIndex.load().
+        """
+        with open(os.path.join(path, 'compactModel.json')) as f:
+            metadata = json.load(f)
+        assert metadata['formatVersion'] == cls.formatVersion, \
+            'unsupported compact model format version'
+        return cls(
+            ModelIndex.load(path, mmapMode),
+            np.load(os.path.join(path, 'bounds.npy'), mmap_mode=mmapMode),
+            metadata['currencyMetabolites'],
+            path,
+            )
+
+    @staticmethod
+    def isCompactModel(path):
+        """Returns whether a path is a directory written by save()."""
+        return os.path.isfile(os.path.join(path, 'compactModel.json'))
+
+    @property
+    def reactionIds(self):
+        """list: All reaction names of type str in the model."""
+        return self.index.reactionIds
+
+    @property
+    def exchangeIds(self):
+        """set: Names of the reactions with a single metabolite."""
+        stoichiometry = self.index.stoichiometry
+        return {self.index.reactionIds[i]
+            for i in np.flatnonzero(np.diff(stoichiometry.indptr) == 1)}
+
+    def indexFor(self, currencyMetabolites):
+        """Returns the index of the model with these currency metabolites,
+        which is only rebuilt if they differ from those saved."""
+        key = frozenset(currencyMetabolites)
+        if key not in self._indices:
+            index = self.index
+            self._indices[key] = ModelIndex(
+                index.reactionIds,
+                index.metaboliteIds,
+                index.stoichiometry,
+                index.reversible,
+                [m in key for m in index.metaboliteIds],
+                )
+        return self._indices[key]
+
+    def copy(self):
+        return self
+
+    def __getstate__(self):
+        if self.path is not None:
+            return {'path': self.path}
+        state = dict(self.__dict__)
+        state['_indices'] = {}
+        state['_engines'] = {}
+        return state
+
+    def __setstate__(self, state):
+        if 'path' in state and len(state) == 1:
+            state = CompactModel.load(state['path']).__dict__
+        self.__dict__.update(state)
+        self._indices = {self.currencyMetabolites: self.index}
+        self._engines = {}
+
+def modelReactionIds(model):
+    """Returns the reaction names of a COBRApy or compact model in order."""
+    if isinstance(model, CompactModel):
+        return model.reactionIds
+    return [r.id for r in model.reactions]
+
+def modelBounds(model):
+    """Returns the reaction bounds of a COBRApy or compact model, with one
+    row per reaction."""
+    if isinstance(model, CompactModel):
+        return np.asarray(model.bounds, dtype=float)
+    return np.array([r.bounds for r in model.reactions],
+        dtype=float).reshape(len(model.reactions), 2)
+
+def modelIndex(model, currencyMetabolites):
+    """Returns the index of a COBRApy or compact model."""
+    if isinstance(model, CompactModel):
+        return model.indexFor(currencyMetabolites)
+    return ModelIndex.fromModel(model, currencyMetabolites)
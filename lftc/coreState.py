@@ -0,0 +1,133 @@
+"""
+Compact core state for simulated annealing, stored as a bool mask over
+the reactions of a model
+
+By Tyler W. H. Backman
+"""
+
+import numpy as np
+
+
+class CoreState(object):
+
+    __slots__ = ('reactionIds', 'reactionIndex', 'mask', 'size')
+
+    def __init__(self, reactionIds, reactionIndex, mask=None):
+        """Set of core reaction names backed by a numpy bool array.
+
+        Behaves like a set of reaction names of type str for membership,
+        iteration, add and remove, but copies in a single array copy and
+        can be hashed cheaply with key(). Reaction names are iterated in
+        model order. CoreState objects are normally created with fromSet(),
+        and share the reaction list of the index they were created from.
+
+        Args:
+            reactionIds (list): All reaction names of type str in the model.
+            reactionIndex (dict): Position of each reaction name in
+                reactionIds.
+            mask (numpy.ndarray): Optional, a bool mask over reactionIds of
+                the reactions in the core. Defaults to an empty core.
+        """
+        self.reactionIds = reactionIds
+        self.reactionIndex = reactionIndex
+        if mask is None:
+            mask = np.zeros(len(reactionIds), dtype=bool)
+        self.mask = mask
+        self.size = int(np.count_nonzero(mask))
+
+    @classmethod
+    def fromSet(cls, reactionNames, index):
+        """Create a core state from reaction names and a ModelIndex."""
+        return cls(
+            index.reactionIds,
+            index.reactionIndex,
+            index.reactionMask(reactionNames),
+            )
+
+    def toSet(self):
+        """Returns the core as a set of reaction names of type str."""
+        return set(self)
+
+    def key(self):
+        """Returns a compact hashable identity of the core."""
+        return np.packbits(self.mask).tobytes()
+
+    def copy(self):
+        return CoreState(self.reactionIds, self.reactionIndex, self.mask.copy())
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, reactionName):
+        i = self.reactionIndex.get(reactionName)
+        return i is not None and bool(self.mask[i])
+
+    def __iter__(self):
+        reactionIds = self.reactionIds
+        return (reactionIds[i] for i in np.flatnonzero(self.mask))
+
+    def __eq__(self, other):
+        if isinstance(other, CoreState):
+            if self.reactionIds is other.reactionIds:
+                return bool(np.array_equal(self.mask, other.mask))
+            return self.size == other.size and self.toSet() == other.toSet()
+        if isinstance(other, (set, frozenset)):
+            return self.size == len(other) and all(r in self for r in other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # mutable, so unhashable like set, use key() for caching
+    __hash__ = None
+
+    def __repr__(self):
+        return 'CoreState(%s)' % repr(self.toSet())
+
+    def __getstate__(self):
+        return {
+            'reactionIds': self.reactionIds,
+            'packedMask': np.packbits(self.mask),
+            }
+
+    def __setstate__(self, state):
+        self.reactionIds = state['reactionIds']
+        self.reactionIndex = {r: i for i, r in enumerate(self.reactionIds)}
+        self.mask = np.unpackbits(
+            state['packedMask'])[:len(self.reactionIds)].astype(bool)
+        self.size = int(np.count_nonzero(self.mask))
+
+    def add(self, reactionName):
+        i = self.reactionIndex[reactionName]
+        if not self.mask[i]:
+            self.mask[i] = True
+            self.size += 1
+
+    def remove(self, reactionName):
+        if reactionName not in self:
+            raise KeyError(reactionName)
+        self.discard(reactionName)
+
+    def discard(self, reactionName):
+        i = self.reactionIndex.get(reactionName)
+        if i is not None and self.mask[i]:
+            self.mask[i] = False
+            self.size -= 1
+
+    def update(self, reactionNames):
+        for reactionName in reactionNames:
+            self.add(reactionName)
+
+    def difference_update(self, reactionNames):
+        for reactionName in reactionNames:
+            self.discard(reactionName)
+
+    def intersection(self, reactionNames):
+        return {r for r in reactionNames if r in self}
+
+    def difference(self, reactionNames):
+        return self.toSet().difference(reactionNames)
+
+    def union(self, reactionNames):
+        return self.toSet().union(reactionNames)
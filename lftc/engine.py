@@ -0,0 +1,350 @@
+"""
+Persistent linear programming engine used to score many cores against
+a single genome scale model
+
+By Tyler W. H. Backman
+"""
+
+import numpy as np
+import pandas as pd
+from .boundaryTracker import BoundaryTracker
+from .modelIndex import ModelIndex
+from .timing import NullTimer
+
+
+class CoreFluxResult(object):
+
+    __slots__ = (
+        'fluxIntoCore',
+        'reactionIds',
+        'producingIndices',
+        'producingValues',
+        'consumingIndices',
+        'consumingValues',
+        '_producingFluxes',
+        '_consumingFluxes',
+        )
+
+    def __init__(
+        self,
+        fluxIntoCore,
+        reactionIds,
+        producingIndices,
+        producingValues,
+        consumingIndices,
+        consumingValues,
+        ):
+        """Compact result of limit flux to core.
+
+        Holds the boundary fluxes as numpy arrays of reaction positions and
+        clipped fluxes, in model order. The pandas Series returned by
+        limitFluxToCore() are only built when producingFluxes or
+        consumingFluxes are first used. Unpacks like the tuple returned by
+        limitFluxToCore().
+
+        Args:
+            fluxIntoCore (numpy.float64): The sum of fluxes into core
+                metabolism.
+            reactionIds (list): All reaction names of type str in the model.
+            producingIndices (numpy.ndarray): Positions in reactionIds of all
+                reactions that produce metabolites in the core.
+            producingValues (numpy.ndarray): The (positive or zero) fluxes
+                of the producing reactions.
+            consumingIndices (numpy.ndarray): Positions in reactionIds of all
+                reversible reactions that can produce metabolites in the core
+                in reverse direction.
+            consumingValues (numpy.ndarray): The (negative or zero) fluxes of
+                the consuming reactions.
+        """
+        self.fluxIntoCore = fluxIntoCore
+        self.reactionIds = reactionIds
+        self.producingIndices = producingIndices
+        self.producingValues = producingValues
+        self.consumingIndices = consumingIndices
+        self.consumingValues = consumingValues
+        self._producingFluxes = None
+        self._consumingFluxes = None
+
+    def _series(self, indices, values):
+        reactionIds = self.reactionIds
+        return pd.Series(values, index=[reactionIds[i] for i in indices],
+            dtype=float)
+
+    @property
+    def producingFluxes(self):
+        """pandas.core.series.Series: Producing fluxes by reaction name."""
+        if self._producingFluxes is None:
+            self._producingFluxes = self._series(
+                self.producingIndices, self.producingValues)
+        return self._producingFluxes
+
+    @property
+    def consumingFluxes(self):
+        """pandas.core.series.Series: Consuming fluxes by reaction name."""
+        if self._consumingFluxes is None:
+            self._consumingFluxes = self._series(
+                self.consumingIndices, self.consumingValues)
+        return self._consumingFluxes
+
+    @property
+    def nbytes(self):
+        """int: Approximate size of the arrays held by the result."""
+        return self.producingIndices.nbytes + self.producingValues.nbytes + \
+            self.consumingIndices.nbytes + self.consumingValues.nbytes
+
+    def __iter__(self):
+        return iter((self.fluxIntoCore, self.producingFluxes,
+            self.consumingFluxes))
+
+
+class SweepResult(object):
+
+    def __init__(self, conditions, reactionIds, fluxIntoCore, fluxes,
+        producing, consuming):
+        """Limit flux to core results of one core under many conditions.
+
+        Holds one row per condition in numpy arrays over all reactions of
+        the model, in model order.
+
+        Args:
+            conditions (list): The condition names, in row order.
+            reactionIds (list): All reaction names of type str in the model.
+            fluxIntoCore (numpy.ndarray): The sum of fluxes into core
+                metabolism under each condition, or nan if the condition
+                was infeasible.
+            fluxes (numpy.ndarray): The clipped boundary fluxes under each
+                condition, positive for producing reactions, negative for
+                consuming reactions and zero elsewhere.
+            producing (numpy.ndarray): Bool masks of the reactions that
+                produce metabolites in the core under each condition.
+            consuming (numpy.ndarray): Bool masks of the reversible
+                reactions that can produce metabolites in the core in
+                reverse direction under each condition.
+        """
+        self.conditions = list(conditions)
+        self.reactionIds = reactionIds
+        self.fluxIntoCore = fluxIntoCore
+        self.fluxes = fluxes
+        self.producing = producing
+        self.consuming = consuming
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def __getitem__(self, condition):
+        """Returns the lftc.CoreFluxResult of a condition by name."""
+        row = self.conditions.index(condition)
+        producingIndices = np.flatnonzero(self.producing[row])
+        consumingIndices = np.flatnonzero(self.consuming[row])
+        return CoreFluxResult(
+            self.fluxIntoCore[row],
+            self.reactionIds,
+            producingIndices,
+            self.fluxes[row, producingIndices],
+            consumingIndices,
+            self.fluxes[row, consumingIndices],
+            )
+
+    def toFrame(self):
+        """Returns the boundary fluxes as one tidy table.
+
+        Returns:
+            results (pandas.core.frame.DataFrame): One row per boundary
+                reaction of each condition, with columns condition,
+                fluxIntoCore, reaction, boundary ('producing' or
+                'consuming') and flux.
+        """
+        tables = []
+        for boundary, masks in (
+            ('producing', self.producing), ('consuming', self.consuming)):
+            rows, reactions = np.nonzero(masks)
+            tables.append(pd.DataFrame({
+                'condition': [self.conditions[i] for i in rows],
+                'fluxIntoCore': self.fluxIntoCore[rows],
+                'reaction': [self.reactionIds[i] for i in reactions],
+                'boundary': boundary,
+                'flux': self.fluxes[rows, reactions],
+                'row': rows,
+                }))
+        table = pd.concat(tables, ignore_index=True)
+        table = table.sort_values(['row', 'boundary'],
+            ascending=[True, False], kind='stable')
+        return table.drop(columns='row').reset_index(drop=True)
+
+
+class FluxEngine(object):
+
+    def __init__(self, index, currencyMetabolites, timer=None):
+        """Base of the persistent limit flux to core solvers.
+
+        Tracks the boundary of the last scored core, and scores a new core
+        by only changing the objective coefficients of the reactions which
+        entered or left the boundary. Subclasses hold the linear program,
+        and implement _updateObjective(), _solve(), _setReactionBounds()
+        and netFluxes().
+
+        Args:
+            index (lftc.modelIndex.ModelIndex): The index of the model.
+            currencyMetabolites (set): A set of metabolites to exclude
+                when identifying reactions which feed carbon into the core.
+            timer (lftc.PhaseTimer): Optional, times the boundary, objective,
+                solve and extract phases of each evaluation.
+        """
+        self.timer = NullTimer() if timer is None else timer
+        self.currencyMetabolites = currencyMetabolites
+        self.index = index
+
+        # the boundary of the last scored core, which defines which
+        # variables currently have a coefficient of one in the objective
+        self.boundary = BoundaryTracker(index)
+
+    def evaluate(self, coreReactionNames, compact=False):
+        """Score a core, reusing the solver state from the previous call.
+
+        Args:
+            coreReactionNames (set): The set of reaction names of type str
+                from model included in core, or a lftc.CoreState.
+            compact (bool): Optional, return a lftc.CoreFluxResult instead
+                of a tuple.
+
+        Returns:
+            (tuple): tuple containing:
+                arg1 (numpy.float64): The sum of fluxes into core metabolism.
+                arg2 (pandas.core.series.Series): The (positive or zero) upper
+                    flux bound of all fluxes that produce metabolites in the
+                    core.
+                arg3 (pandas.core.series.Series): The (negative or zero) lower
+                    flux bound of all reversible reaction fluxes that can
+                    produce metabolites in the core in reverse direction.
+        """
+        index = self.index
+        timer = self.timer
+
+        # update reactions to minimize from the last scored core
+        with timer.phase('boundary'):
+            boundary = self.boundary
+            boundary.update(index.reactionMask(coreReactionNames))
+            addedProducing, removedProducing, \
+                addedConsuming, removedConsuming = boundary.diff()
+
+        # simultaneously minimize reactions which produce metabolites in core,
+        # and maximize reversible reactions which consume metabolites from core,
+        # only changing the coefficients that changed
+        with timer.phase('objective'):
+            self._updateObjective(addedProducing, removedProducing,
+                addedConsuming, removedConsuming)
+
+        with timer.phase('solve'):
+            self._solve()
+
+        # get clipped fluxes from solution
+        with timer.phase('extract'):
+            producingIndices = np.flatnonzero(boundary.producing)
+            consumingIndices = np.flatnonzero(boundary.consuming)
+            producingValues = np.maximum(self.netFluxes(producingIndices), 0)
+            consumingValues = np.minimum(self.netFluxes(consumingIndices), 0)
+            fluxIntoCore = np.float64(
+                producingValues.sum() - consumingValues.sum())
+
+        result = CoreFluxResult(
+            fluxIntoCore,
+            index.reactionIds,
+            producingIndices,
+            producingValues,
+            consumingIndices,
+            consumingValues,
+            )
+        if compact:
+            return result
+        return tuple(result)
+
+    def setBounds(self, reactionIndices, bounds):
+        """Change the bounds of reactions, keeping the engine.
+
+        Reactions which become reversible or irreversible change the
+        boundary of the core, as they would for limitFluxToCore() on a
+        model with these bounds.
+
+        Args:
+            reactionIndices (numpy.ndarray): Positions of the reactions in
+                the index.
+            bounds (numpy.ndarray): The new lower and upper bound of each
+                reaction, with one row per reaction.
+        """
+        bounds = np.asarray(bounds, dtype=float).reshape(-1, 2)
+        reactionIndices = np.asarray(reactionIndices, dtype=np.int64)
+        self._setReactionBounds(reactionIndices, bounds)
+        self.index = self.boundary.setReversible(
+            reactionIndices, (bounds[:, 0] < 0) & (bounds[:, 1] > 0))
+
+    def netFluxes(self, reactionIndices):
+        """Returns the fluxes of the last solve for reaction positions."""
+        raise NotImplementedError
+
+
+class CoreFluxEngine(FluxEngine):
+
+    def __init__(self, model, currencyMetabolites, timer=None):
+        """Incremental limit flux to core solver.
+
+        Keeps one live solver problem for a model, and scores cores by only
+        changing the objective coefficients which differ from the previously
+        scored core. The solver keeps its last basis between calls, so
+        scoring a core which differs by a single reaction from the last one
+        typically costs only a few simplex pivots, including after
+        setBounds().
+
+        The objective of the model is owned by the engine once created, so
+        pass a copy if the model must be left unmodified.
+
+        Args:
+            model (cobra.core.model.Model): A COBRApy genome scale model.
+            currencyMetabolites (set): A set of metabolites to exclude
+                when identifying reactions which feed carbon into the core.
+            timer (lftc.PhaseTimer): Optional, times the boundary, objective,
+                solve and extract phases of each evaluation.
+        """
+        super(CoreFluxEngine, self).__init__(
+            ModelIndex.fromModel(model, currencyMetabolites),
+            currencyMetabolites,
+            timer,
+            )
+        self.model = model
+        self.reactions = list(model.reactions)
+        self.forwardVariables = [r.forward_variable for r in self.reactions]
+        self.reverseVariables = [r.reverse_variable for r in self.reactions]
+
+        # presolve discards the basis, so disable it to warm start each solve
+        self.model.solver.configuration.presolve = False
+        self.model.objective = {}
+        self.model.objective.direction = 'min'
+
+    def _updateObjective(self, addedProducing, removedProducing,
+        addedConsuming, removedConsuming):
+        # only send the coefficients that changed to the solver
+        forwardVariables = self.forwardVariables
+        reverseVariables = self.reverseVariables
+        coefficients = {}
+        coefficients.update((forwardVariables[i], 0) for i in removedProducing)
+        coefficients.update((forwardVariables[i], 1) for i in addedProducing)
+        coefficients.update((reverseVariables[i], 0) for i in removedConsuming)
+        coefficients.update((reverseVariables[i], 1) for i in addedConsuming)
+        if coefficients:
+            self.model.solver.objective.set_linear_coefficients(coefficients)
+
+    def _solve(self):
+        self.model.slim_optimize(error_value=None)
+
+    def _setReactionBounds(self, reactionIndices, bounds):
+        for i, (lower, upper) in zip(reactionIndices, bounds):
+            self.reactions[i].bounds = (float(lower), float(upper))
+
+    def netFluxes(self, reactionIndices):
+        """Returns the fluxes of the last solve for reaction positions."""
+        forwardVariables = self.forwardVariables
+        reverseVariables = self.reverseVariables
+        return np.array(
+            [forwardVariables[i].primal - reverseVariables[i].primal
+                for i in reactionIndices],
+            dtype=float,
+            )
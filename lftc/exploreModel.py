@@ -4,6 +4,8 @@ These are backend functions for navigating an SBML model using COBRApy
 By Tyler W. H. Backman
 """
 
+import numpy as np
+
 def findSubsetConnectedToFeed(coreReactionNames, feed, currencyMetabolites, model):
     # start with the feed and make sure core is connected to feed
 
@@ -87,3 +89,101 @@ def findReversibleConsumingReactionsOutsideCore(allMetaboliteNames, model, coreR
         externalConsumingReactions = {r.id for r in consumingReactions}.difference(coreReactionNames)
         allConsumingReactions.update(externalConsumingReactions)
     return allConsumingReactions
+
+# The following versions operate on a lftc.modelIndex.ModelIndex, where sets
+# of reactions and metabolites are numpy bool masks, using sparse
+# matrix-vector products instead of walking COBRApy objects.
+
+def findSubsetConnectedToFeedIndexed(coreMask, feedIndex, index):
+    # start with the feed and make sure core is connected to feed,
+    # expanding one level of the reaction-metabolite graph at a time
+
+    connected = np.zeros(len(coreMask), dtype=bool)
+    connected[feedIndex] = True
+    frontier = connected.copy()
+    while frontier.any():
+        metabolites = index.adjacencyT.dot(frontier.astype(np.int8)) > 0
+        reactions = index.adjacency.dot(metabolites.astype(np.int8)) > 0
+        frontier = reactions & coreMask & ~connected
+        connected |= frontier
+    return connected
+
+def findConsumedMetabolitesIndexed(coreMask, index):
+    # find all potential sources and exchanges: e.g. metabolites which can be consumed by core reactions
+
+    consumed = index.reactantsT.dot(coreMask.astype(np.int8)) > 0
+    consumed |= index.productsT.dot(
+        (coreMask & index.reversible).astype(np.int8)) > 0
+
+    # exclude currency reactions that don't transfer any carbon into core
+    return consumed & ~index.currency
+
+def findProducingReactionsOutsideCoreIndexed(metaboliteMask, index, coreMask):
+    # find all reactions which can produce these metabolites, and are not in the core
+
+    producing = index.products.dot(metaboliteMask.astype(np.int8)) > 0
+    return producing & ~coreMask
+
+def findReversibleConsumingReactionsOutsideCoreIndexed(metaboliteMask, index, coreMask):
+    # find all reactions which consume metabolites from core, but are reversible, so they can
+    # potentially feed carbon into the core
+
+    consuming = index.reactants.dot(metaboliteMask.astype(np.int8)) > 0
+    return consuming & index.reversible & ~coreMask
+
+def findRemovableReactionsIndexed(coreMask, feedIndex, index):
+    # find every core reaction which can be removed without disconnecting any
+    # other core reaction from the feed, in a single depth first search over the
+    # bipartite reaction-metabolite graph of the core (Tarjan's articulation
+    # points). Reactions are nodes r >= 0 and metabolites are nodes -(m + 1).
+
+    removable = np.zeros(len(coreMask), dtype=bool)
+    inCore = coreMask.copy()
+    inCore[feedIndex] = True
+
+    def neighbors(node):
+        if node >= 0:
+            row = slice(index.adjacency.indptr[node],
+                index.adjacency.indptr[node + 1])
+            return [-(m + 1) for m in index.adjacency.indices[row]]
+        m = -node - 1
+        row = slice(index.adjacencyT.indptr[m], index.adjacencyT.indptr[m + 1])
+        return [r for r in index.adjacencyT.indices[row] if inCore[r]]
+
+    discovered = {feedIndex: 0}
+    low = {feedIndex: 0}
+    reactionsBelow = {feedIndex: 1}
+    separating = set()
+    stack = [(feedIndex, None, iter(neighbors(feedIndex)))]
+    while stack:
+        node, parent, unexplored = stack[-1]
+        for neighbor in unexplored:
+            if neighbor == parent:
+                continue
+            if neighbor in discovered:
+                low[node] = min(low[node], discovered[neighbor])
+            else:
+                discovered[neighbor] = low[neighbor] = len(discovered)
+                reactionsBelow[neighbor] = int(neighbor >= 0)
+                stack.append((neighbor, node, iter(neighbors(neighbor))))
+                break
+        else:
+            stack.pop()
+            if parent is not None:
+                low[parent] = min(low[parent], low[node])
+                reactionsBelow[parent] += reactionsBelow[node]
+
+                # a reaction separates the feed from any core reaction
+                # below it, unless that subtree can reach above it
+                if parent >= 0 and reactionsBelow[node] > 0 \
+                    and low[node] >= discovered[parent]:
+                    separating.add(parent)
+
+    # if some of the core is already disconnected, nothing is removable
+    if reactionsBelow[feedIndex] < inCore.sum():
+        return removable
+
+    removable[inCore] = True
+    removable[feedIndex] = False
+    removable[list(separating)] = False
+    return removable
@@ -0,0 +1,56 @@
+"""
+Content fingerprints of models and problems, used to key results cached on
+disk between runs
+
+By Tyler W. H. Backman
+"""
+
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+
+
+def fingerprint(*parts):
+    """Returns a hex SHA-256 digest identifying a sequence of values.
+
+    Args:
+        *parts: numpy arrays, scipy sparse matrices, or any values with a
+            stable repr, such as str, float, or lists and tuples of them.
+
+    Returns:
+        digest (str): The hex digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if sp.issparse(part):
+            part = sp.csr_matrix(part)
+            part.sort_indices()
+            digest.update(repr(part.shape).encode())
+            for array in (part.indptr, part.indices, part.data):
+                digest.update(np.ascontiguousarray(array).tobytes())
+        elif isinstance(part, np.ndarray):
+            digest.update((str(part.dtype) + repr(part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def indexFingerprint(index, bounds):
+    """Returns a fingerprint of a model index and its reaction bounds.
+
+    Args:
+        index (lftc.modelIndex.ModelIndex): The index of the model.
+        bounds (numpy.ndarray): The lower and upper bound of each reaction,
+            with one row per reaction.
+
+    Returns:
+        digest (str): The hex digest.
+    """
+    return fingerprint(
+        index.reactionIds,
+        index.metaboliteIds,
+        index.stoichiometry,
+        np.asarray(bounds, dtype=float),
+        index.currency,
+        )
@@ -7,15 +7,27 @@ By Tyler W. H. Backman
 import pandas as pd
 import numpy as np
 import cobra
+import contextlib
 import re
 from .anneal import Annealer
+from .cache import CoreEnergyCache, DiskResultCache
+from .compactModel import CompactModel, modelBounds, modelIndex, \
+    modelReactionIds
+from .coreState import CoreState
+from .engine import CoreFluxEngine
+from .fingerprint import fingerprint, indexFingerprint
+from .matrixEngine import MatrixFluxEngine
+from .timing import PhaseTimer, NullTimer
+from .trace import TraceRecorder, readTrace
 from .exploreModel import \
     findSubsetConnectedToFeed, \
     findProducingReactions, \
     findConsumingReversibleReactions, \
     findConsumedMetabolites, \
     findProducingReactionsOutsideCore, \
-    findReversibleConsumingReactionsOutsideCore
+    findReversibleConsumingReactionsOutsideCore, \
+    findSubsetConnectedToFeedIndexed, \
+    findRemovableReactionsIndexed
 
 # define a default set of currency metabolites
 currencyMetabolites = set(['h2o_c', 'pi_c', 'co2_c', 'atp_c', 'coa_c', 'imp_c',
@@ -25,11 +37,113 @@ currencyMetabolites = set(['h2o_c', 'pi_c', 'co2_c', 'atp_c', 'coa_c', 'imp_c',
                            'q8h2_c', 'q8_c', 'fad_c', 'fadh2_c'])
 currencyMetabolites.update({re.sub('_c', '_m', r) for r in currencyMetabolites})
 
+# solvers which can score cores, by backend name
+fluxEngines = {'cobra': CoreFluxEngine, 'matrix': MatrixFluxEngine}
+
+def _resolveBackend(model, backend):
+    # default and check the backend for a model, which may be a path
+
+    compactModel = isinstance(model, CompactModel) or \
+        (isinstance(model, str) and CompactModel.isCompactModel(model))
+    if backend is None:
+        backend = 'matrix' if compactModel else 'cobra'
+    assert backend in fluxEngines, 'unknown backend'
+    assert backend == 'matrix' or not compactModel, \
+        'compact models require the matrix backend'
+    return backend
+
+@contextlib.contextmanager
+def modelTransaction(model):
+    """Roll back the changes made to a model within a with block.
+
+    Uses the COBRApy model context, so objective, bound and other changes
+    made through COBRApy are undone on exit, even if the block raises. Also
+    restores the solver presolve setting, which COBRApy doesn't track. This
+    is much cheaper than copying a genome scale model, but changes made
+    directly to the solver are not rolled back.
+
+    Args:
+        model (cobra.core.model.Model): A COBRApy genome scale model.
+
+    Yields:
+        model (cobra.core.model.Model): The same model.
+    """
+    configuration = model.solver.configuration
+    presolve = configuration.presolve
+    with model:
+        try:
+            yield model
+        finally:
+            configuration.presolve = presolve
+
+def saveCompactModel(model, path, currencyMetabolites=currencyMetabolites):
+    """Save a model in the compact format, for fast loading.
+
+    Writes the stoichiometry, reaction-metabolite adjacency and reaction
+    bounds of a model as numpy arrays to a directory, so that it can be
+    loaded with loadCompactModel() in milliseconds without parsing SBML.
+    The adjacency is precomputed for the given currency metabolites.
+
+    Args:
+        model (cobra.core.model.Model): A COBRApy genome scale model.
+        path (str): The directory to write, which is created if needed.
+        currencyMetabolites (set): Optional, the set of metabolites to
+            exclude when identifying reactions which feed carbon into the
+            core. If excluded, the lftc.currencyMetabolites default set is
+            used.
+
+    Returns:
+        model (lftc.CompactModel): The compact model which was saved.
+    """
+    assert type(model) is cobra.core.model.Model, \
+        'model is not of type cobra.core.model.Model'
+    assert type(currencyMetabolites) is set, 'currencyMetabolites is not a set'
+    compactModel = CompactModel.fromModel(model, currencyMetabolites)
+    compactModel.save(path)
+    compactModel.path = path
+    return compactModel
+
+def loadCompactModel(path):
+    """Load a model saved with saveCompactModel().
+
+    The arrays are memory mapped, so processes loading the same model share
+    its pages. The result can be passed as the model to limitFluxToCore(),
+    OptimalCoreProblem and the lftc.parallel functions, which then score
+    cores with the matrix backend. Passing the path itself to the
+    lftc.parallel functions lets each worker load it.
+
+    Args:
+        path (str): The directory written by saveCompactModel().
+
+    Returns:
+        model (lftc.CompactModel): The loaded model.
+    """
+    assert CompactModel.isCompactModel(path), \
+        'path is not a compact model directory'
+    return CompactModel.load(path)
+
+def _matrixEngine(model, currencyMetabolites, timer):
+    # compact models are never modified, so their engines are kept between
+    # calls, while cobra models may change and are read again each call
+    if type(model) is not CompactModel:
+        return MatrixFluxEngine(model, currencyMetabolites, timer)
+    key = frozenset(currencyMetabolites)
+    engine = model._engines.get(key)
+    if engine is None:
+        engine = MatrixFluxEngine(model, currencyMetabolites, timer)
+        model._engines[key] = engine
+    engine.timer = timer
+    return engine
+
 def limitFluxToCore(
     coreReactionNames, 
     model, 
     currencyMetabolites=currencyMetabolites, 
-    copyModel=True
+    copyModel=True,
+    compact=False,
+    timer=None,
+    backend=None,
+    cache=None,
     ):
     """Main limit flux to core algorithm.
 
@@ -38,13 +152,36 @@ def limitFluxToCore(
 
     Args:
         coreReactionNames (set): The set of reaction names of type str from 
-            model included in core.
-        model (cobra.core.model.Model): A COBRApy genome scale model.
+            model included in core, or a lftc.CoreState.
+        model (cobra.core.model.Model): A COBRApy genome scale model, or a
+            lftc.CompactModel from loadCompactModel().
         currencyMetabolites (set): Optional, a set of metabolites to exclude 
             when identifying reactions which feed carbon into the core. If 
             excluded, the lftc.currencyMetabolites default set is used.
-        copyModel (bool): Should the model be copied first to avoid 
-            modification? Otherwise, it's objective function will be altered.
+        copyModel (bool): Should the model be left unmodified? The
+            objective set for the solve is then rolled back on return with
+            modelTransaction(), without copying the model. Otherwise, it's
+            objective function will be altered. The solver presolve setting
+            is restored either way.
+        compact (bool): Optional, return a lftc.CoreFluxResult holding numpy
+            arrays instead of a tuple, which only builds the pandas Series
+            when they are used. It unpacks like the tuple.
+        timer (lftc.PhaseTimer): Optional, times the boundary, objective,
+            solve and extract phases.
+        backend (str): Optional, 'cobra' to solve through the COBRApy model
+            and its configured solver, or 'matrix' to solve the stoichiometric
+            matrix directly with SciPy HiGHS, which never modifies the model.
+            The matrix backend only uses the mass balance and reaction bounds
+            of the model. Its engine is built once and reused by later calls
+            on a lftc.CompactModel, but rebuilt on every call for a COBRApy
+            model, which is slower than 'cobra' for single calls. Defaults
+            to 'matrix' for a lftc.CompactModel, which requires it, and
+            'cobra' otherwise.
+        cache (lftc.DiskResultCache): Optional, a persistent cache to look
+            the result up in before solving, and to store it in after.
+            Results are keyed on the model stoichiometry, reaction bounds,
+            currency metabolites and core, so other constraints of the
+            model must not change between runs sharing a cache.
 
     Returns:
         (tuple): tuple containing:
@@ -54,75 +191,77 @@ def limitFluxToCore(
             arg3 (pandas.core.series.Series): The (negative or zero) lower 
                 flux bound of all reversible reaction fluxes that can produce 
                 metabolites in the core in reverse direction.
+
+    Raises:
+        cobra.exceptions.OptimizationError: If the model has no feasible
+            flux distribution, for example when its bounds require more
+            growth than the feed allows. The cobra backend raises the
+            cobra.exceptions.Infeasible subclass. Earlier versions warned
+            and returned the value of the failed solve instead.
     """
 
     # sanity check inputs
-    assert type(model) is cobra.core.model.Model, \
+    assert type(model) in (cobra.core.model.Model, CompactModel), \
         'model is not of type cobra.core.model.Model'
-    assert type(coreReactionNames) is set, 'coreReactionNames is not a set'
-    assert 0 < len(coreReactionNames) <= len(model.reactions), \
+    reactionNames = modelReactionIds(model)
+    assert type(coreReactionNames) in (set, CoreState), \
+        'coreReactionNames is not a set'
+    assert 0 < len(coreReactionNames) <= len(reactionNames), \
         'invalid size for coreReactionNames'
-    assert len(coreReactionNames.intersection([r.id for r in model.reactions])) \
+    assert len(coreReactionNames.intersection(reactionNames)) \
         == len(coreReactionNames), 'some core reaction names missing from model'
     assert type(copyModel) is bool, 'copyModel not type bool'
     assert type(currencyMetabolites) is set, 'currencyMetabolites is not a set'
-
-    if copyModel:
-        model = model.copy()
-    
-    # find reactions to minimize
-    allMetaboliteNames = findConsumedMetabolites(
-        coreReactionNames, 
-        model, 
-        currencyMetabolites,
-        )
-    allProducingReactions = findProducingReactionsOutsideCore(
-        allMetaboliteNames, 
-        model, 
-        coreReactionNames,
-        )
-    allConsumingReactions = findReversibleConsumingReactionsOutsideCore(
-        allMetaboliteNames, 
-        model, 
-        coreReactionNames,
-        )
-    
-    # set the objective function to simultaneously minimize reactions 
-    # which produce metabolites in core, and maximize
-    # reversible reactions which consume metabolites from core
-    objective = {}
-    for reactionName in allProducingReactions:
-        reaction = model.reactions.get_by_id(reactionName)
-        objective[reaction.forward_variable] = 1
-    for reactionName in allConsumingReactions:
-        reaction = model.reactions.get_by_id(reactionName)
-        objective[reaction.reverse_variable] = 1
-        
-    # set the objective for the model, and run FBA
-    model.objective = {}
-    model.objective.set_linear_coefficients(objective)
-    model.objective.direction = 'min'
-    fba_solution = model.optimize()
-    
-    # get fluxes from solution
-    fluxIntoCore = 0
-    producingFluxes = fba_solution.fluxes[allProducingReactions]
-    for producingFlux in producingFluxes.index:
-        if producingFluxes[producingFlux] < 0:
-            producingFluxes[producingFlux] = 0
-        fluxIntoCore += producingFluxes[producingFlux]
-    consumingFluxes = fba_solution.fluxes[allConsumingReactions]
-    for consumingFlux in consumingFluxes.index:
-        if consumingFluxes[consumingFlux] > 0:
-            consumingFluxes[consumingFlux] = 0
-        fluxIntoCore -= consumingFluxes[consumingFlux]
-    
-    return fluxIntoCore, producingFluxes, consumingFluxes
-
-def setModelFluxes(model, producingFluxes, consumingFluxes):
+    assert type(compact) is bool, 'compact not type bool'
+    backend = _resolveBackend(model, backend)
+
+    assert cache is None or isinstance(cache, DiskResultCache), \
+        'cache is not a lftc.DiskResultCache'
+
+    if timer is None:
+        timer = NullTimer()
+
+    if cache is not None:
+        with timer.phase('cache'):
+            index = modelIndex(model, currencyMetabolites)
+            key = cache.key(index, modelBounds(model), coreReactionNames)
+            result = cache.get(key, index.reactionIds)
+        if result is not None:
+            return result if compact else tuple(result)
+
+    if backend == 'matrix':
+        result = _matrixEngine(model, currencyMetabolites, timer).evaluate(
+            coreReactionNames, compact=True)
+    elif copyModel:
+        with modelTransaction(model):
+            result = CoreFluxEngine(model, currencyMetabolites, timer).evaluate(
+                coreReactionNames, compact=True)
+    else:
+        # the objective is left set, but the engine also disables presolve
+        # to warm start, which is restored as modelTransaction() would
+        configuration = model.solver.configuration
+        presolve = configuration.presolve
+        try:
+            result = CoreFluxEngine(model, currencyMetabolites, timer).evaluate(
+                coreReactionNames, compact=True)
+        finally:
+            configuration.presolve = presolve
+    if cache is not None:
+        with timer.phase('cache'):
+            cache.put(key, result)
+    return result if compact else tuple(result)
+
+def setModelFluxes(model, producingFluxes, consumingFluxes, copyModel=True):
     """Apply fluxes to genome scale model.
 
-    Applies flux limits returned by limitFluxToCore() to a genome scale model:
+    Applies flux limits returned by limitFluxToCore() to a genome scale model.
+    With copyModel=False the bounds are set on model itself, so that inside
+    modelTransaction() a bounded model can be evaluated or exported and then
+    rolled back, without ever duplicating it:
+
+        with lftc.modelTransaction(model):
+            lftc.setModelFluxes(model, producing, consuming, copyModel=False)
+            cobra.io.write_sbml_model(model, 'bounded.xml')
 
     Args:
         model (cobra.core.model.Model): A COBRApy genome scale model.
@@ -131,6 +270,8 @@ def setModelFluxes(model, producingFluxes, consumingFluxes):
         consumingFluxes (pandas.core.series.Series): The (negative or zero) 
             lower flux bound of all reversible reaction 
             fluxes that can produce metabolites in the core in reverse direction.
+        copyModel (bool): Optional, apply the bounds to a copy of the model.
+            Otherwise model itself is modified and returned.
 
     Returns:
         model (cobra.core.model.Model): A COBRApy genome scale model with 
@@ -147,22 +288,29 @@ def setModelFluxes(model, producingFluxes, consumingFluxes):
         == len(producingFluxes)
     assert len(set(consumingFluxes.index).intersection(reactionNames)) \
         == len(consumingFluxes)
+    assert type(copyModel) is bool, 'copyModel not type bool'
 
-    newModel = model.copy()
-
-    for reactionName, fluxLimit in producingFluxes.iteritems():
-        reaction = newModel.reactions.get_by_id(reactionName)
-        reaction.upper_bound = fluxLimit
-
-    for reactionName, fluxLimit in consumingFluxes.iteritems():
-        reaction = newModel.reactions.get_by_id(reactionName)
-        reaction.lower_bound = fluxLimit
+    newModel = model.copy() if copyModel else model
+
+    # set both bounds of each reaction at once, so the solver is updated
+    # once per reaction
+    upperBounds = producingFluxes.to_dict()
+    lowerBounds = consumingFluxes.to_dict()
+    for reaction in newModel.reactions.get_by_any(
+        list(upperBounds.keys() | lowerBounds.keys())):
+        reaction.bounds = (
+            lowerBounds.get(reaction.id, reaction.lower_bound),
+            upperBounds.get(reaction.id, reaction.upper_bound),
+            )
 
     return newModel
 
 # specify the optimization problem
 class OptimalCoreProblem(Annealer):
 
+    # states are lftc.CoreState objects, which copy with their copy() method
+    copy_strategy = 'method'
+
     def __init__(
         self, 
         state, 
@@ -173,6 +321,10 @@ class OptimalCoreProblem(Annealer):
         maxOverlapWithModel=1.0,
         excludeReactions=set(),
         logFile=None,
+        cacheBytes=64 * 2 ** 20,
+        timer=None,
+        trace=None,
+        backend=None,
         ):
         """Simulated Annealing Core Optimizer.
 
@@ -180,11 +332,21 @@ class OptimalCoreProblem(Annealer):
         from core, to minimize the required sum of fluxes into core metabolism.
         See docs at https://github.com/perrygeo/simanneal 
         for use of this object once instantiated.
+        Long runs can be checkpointed with set_checkpoint(), and continued
+        after being stopped with anneal(resume=checkpointFile). Progress can
+        be streamed with anneal_iter(), which yields snapshots of the best
+        energy, acceptance rates and reactions added to and removed from
+        the core since the last snapshot, and stops when the loop over it
+        is broken. Use set_stopping() to stop once the best energy stops
+        improving, and see self.stop_reason for why a run stopped.
 
         Args:
             state (set): The set of reaction names of type str to set the 
-                initial starting core state.
-            model (cobra.core.model.Model): A COBRApy genome scale model.
+                initial starting core state, or a lftc.CoreState. During
+                annealing, and in the results, states are lftc.CoreState
+                objects, which can be converted back with toSet().
+            model (cobra.core.model.Model): A COBRApy genome scale model,
+                or a lftc.CompactModel from loadCompactModel().
             feed (str): The carbon uptake feed.
             currencyMetabolites (set): Optional, a set of metabolites to 
                 exclude when identifying reactions which feed carbon into the
@@ -201,15 +363,41 @@ class OptimalCoreProblem(Annealer):
                 str to exclude from any possible core solutions. Sometimes it
                 is desirable to include exchange fluxes here so they don't get
                 added to the core.
+            logFile (str): Optional, a CSV file to append the energy and
+                core size after each annealing step to.
+            trace (str): Optional, a file or lftc.TraceRecorder to record
+                every annealing step to, including temperature, proposed
+                and accepted energy, core size, move type and acceptance.
+                Paths ending in .parquet are written as Parquet. Call
+                self.trace.close() when done, and read it with
+                lftc.readTrace().
+            cacheBytes (int): Optional, the approximate memory in bytes to
+                use for remembering the energy of previously visited cores,
+                so that revisiting a core never requires another solve. Use
+                0 to disable. Statistics are available from
+                self.energyCache.info().
+            timer (lftc.PhaseTimer): Optional, collects call counts and
+                cumulative time of the move, connectivity, copy_state and
+                energy phases, and of the boundary, objective, solve and
+                extract phases within energy. See self.timings().
+            backend (str): Optional, the solver backend used to score cores,
+                'cobra' or 'matrix', as for limitFluxToCore(), which
+                defaults to 'matrix' for a lftc.CompactModel.
+
+        Raises:
+            cobra.exceptions.OptimizationError: From energy(), and so from
+                anneal() and the other searches, if the model has no
+                feasible flux distribution, as for limitFluxToCore().
         """
         # sanity check inputs
-        assert type(model) is cobra.core.model.Model, \
+        assert type(model) in (cobra.core.model.Model, CompactModel), \
             'model is not of type cobra.core.model.Model'
-        reactionNames = [r.id for r in model.reactions]
-        assert type(state) is set, 'state is not a set'
-        assert 0 < len(state) <= len(model.reactions), \
+        reactionNames = modelReactionIds(model)
+        assert type(state) in (set, CoreState), 'state is not a set'
+        state = set(state)
+        assert 0 < len(state) <= len(reactionNames), \
             'invalid size for state'
-        assert len(state.intersection([r.id for r in model.reactions])) \
+        assert len(state.intersection(reactionNames)) \
             == len(state), 'some initial state reaction names missing from model'
         assert type(feed) is str
         assert feed in reactionNames
@@ -221,20 +409,22 @@ class OptimalCoreProblem(Annealer):
         assert type(excludeReactions) is set
         assert len(set(excludeReactions).intersection(reactionNames)) \
             == len(excludeReactions)
+        assert type(cacheBytes) is int
+        backend = _resolveBackend(model, backend)
 
         
         self.currencyMetabolites = currencyMetabolites
         self.model = model.copy()
-        self.maxSize = float(maxOverlapWithModel) * len(self.model.reactions)
+        self.maxSize = float(maxOverlapWithModel) * len(reactionNames)
         self.feed = feed
 
+        self.timer = NullTimer() if timer is None else timer
+        self.backend = backend
+        self.engine = fluxEngines[backend](
+            self.model, self.currencyMetabolites, self.timer)
+
         # confirm that initial state is connected
-        connected = findSubsetConnectedToFeed(
-            state,
-            self.feed,
-            self.currencyMetabolites,
-            self.model,
-            )
+        connected = self.findConnected(state)
         if len(connected) < len(state):
             print('warning, initial core not connected, keeping only', 
                 len(connected), 'reactions out of', len(state))
@@ -242,115 +432,263 @@ class OptimalCoreProblem(Annealer):
 
         # save initial state of core
         self.startSet = state
-        fluxIntoCore, producingFluxes, consumingFluxes = limitFluxToCore(
-            self.startSet, 
-            self.model, 
-            self.currencyMetabolites,
-            False,
-            ) 
-        self.producingFluxes = producingFluxes
-        self.consumingFluxes = consumingFluxes
-
-        # initialize logfile
+        self.startMask = self.engine.index.reactionMask(state)
+        self.excludeMask = self.engine.index.reactionMask(excludeReactions)
+        self.energyCache = CoreEnergyCache(cacheBytes)
+        self.result = self.engine.evaluate(self.startSet, compact=True)
+        self.resultKey = None
+
+        # initialize logfile and trace
         if logFile:
             self.logFile = open(logFile, 'a')
             self.logFile.write('energy,size\n')
         else:
             self.logFile = None
+        if isinstance(trace, TraceRecorder):
+            self.trace = trace
+        elif trace:
+            self.trace = TraceRecorder(trace)
+        else:
+            self.trace = None
+        self.lastMove = 'none'
+
+        # compare energies without solver noise, which depends on the warm
+        # start basis, so that a seed gives the same trajectory regardless
+        # of history
+        self.energy_decimals = 9
         
         self.excludeReactions = excludeReactions
         self.minOverlapWithStart = float(minOverlapWithStart)
 
         assert self.minOverlapWithStart*len(self.startSet) < \
             self.maxSize, 'max size not greater than min size!'
-        super(OptimalCoreProblem, self).__init__(state)  # important!
+        super(OptimalCoreProblem, self).__init__(
+            CoreState.fromSet(state, self.engine.index))  # important!
 
     def move(self):
         # randomly adds or removes a reaction from the core
 
-        # update the logfile with temp from previous move
+        with self.timer.phase('move'):
+            index = self.engine.index
+            self.lastMove = 'none'
+
+            # if the last scored core was a rejected move, rescore the
+            # current core (normally from the cache) to get its boundary
+            if self.resultKey != self.energyCache.key(self.state):
+                self.energy()
+
+            canAdd, canRemoveStart = self.moveLimits(self.state)
+            if np.random.randint(2) and canAdd:
+                # half of the time add a reaction
+                self.lastMove = 'add'
+                boundary = np.zeros(len(index.reactionIds), dtype=bool)
+                boundary[self.result.producingIndices] = True
+                boundary[self.result.consumingIndices] = True
+                boundary &= ~self.excludeMask
+                newReaction = np.random.choice(np.flatnonzero(boundary))
+                self.state.add(index.reactionIds[newReaction])
+            else:
+                # the other half of the time,
+                # remove a reaction which leaves the core connected
+                with self.timer.phase('connectivity'):
+                    removable = self.findRemovable(self.state)
+
+                # if we hit the minimum overlap with the start, don't remove any more
+                # reactions that overlap with start
+                if not canRemoveStart:
+                    removable &= ~self.startMask
+
+                removableIndices = np.flatnonzero(removable)
+                if len(removableIndices) > 0:
+                    reactionIndex = np.random.choice(removableIndices)
+                    self.state.remove(index.reactionIds[reactionIndex])
+                    self.lastMove = 'remove'
+
+    def moveLimits(self, state):
+        """Returns which kinds of move the size and overlap limits allow.
+
+        Used by move() and moveCandidates(), so both follow the same rules.
+
+        Args:
+            state (lftc.CoreState): The core to move from.
+
+        Returns:
+            (tuple): tuple containing:
+                arg1 (bool): Whether a reaction can be added, which is while
+                    the core is below the maximum size.
+                arg2 (bool): Whether reactions of the start core can be
+                    removed, which is while the overlap with the start is
+                    above the minimum.
+        """
+        overlap = np.count_nonzero(state.mask & self.startMask)
+        return (
+            len(state) < self.maxSize,
+            overlap / len(self.startSet) > self.minOverlapWithStart,
+            )
+
+    def moveCandidates(self):
+        """Returns every reaction which a single move could add or remove.
+
+        Additions are reactions on the boundary of the current core, and
+        removals leave the core connected to the feed, within the limits of
+        moveLimits(). Reactions in excludeReactions are never added.
+
+        Returns:
+            (tuple): tuple containing:
+                arg1 (numpy.ndarray): Positions of reactions which could
+                    be added, in model order.
+                arg2 (numpy.ndarray): Positions of reactions which could
+                    be removed, in model order.
+        """
+        if self.resultKey != self.energyCache.key(self.state):
+            self.energy()
+
+        canAdd, canRemoveStart = self.moveLimits(self.state)
+        additions = np.zeros(len(self.engine.index.reactionIds), dtype=bool)
+        if canAdd:
+            additions[self.result.producingIndices] = True
+            additions[self.result.consumingIndices] = True
+            additions &= ~self.excludeMask
+
+        removals = self.findRemovable(self.state)
+        if not canRemoveStart:
+            removals &= ~self.startMask
+        return np.flatnonzero(additions), np.flatnonzero(removals)
+
+    def fingerprint(self):
+        """Returns a hex digest identifying the model, currency metabolites,
+        reaction bounds, start core and constraints of the problem."""
+        return fingerprint(
+            indexFingerprint(self.engine.index, modelBounds(self.model)),
+            self.startMask,
+            self.excludeMask,
+            self.feed,
+            self.minOverlapWithStart,
+            self.maxSize,
+            )
+
+    def record_step(self, step, T, proposed_E, E, accepted):
+        # update the logfile and trace with values from the annealing loop
+
         if self.logFile:
-            self.logFile.write(str(self.energy()) + ',' + \
-                str(len(self.state)) + '\n')
-
-        if np.random.randint(2) and (len(self.state) < self.maxSize):
-            # half of the time add a reaction
-            boundaryReactionNames = set(self.producingFluxes.index)
-            boundaryReactionNames.update(self.consumingFluxes.index)
-            
-            boundaryReactionNames.difference_update(self.excludeReactions)
-            newReaction = np.random.choice(tuple(boundaryReactionNames))
-            self.state.update([newReaction])
-        else:
-            # the other half of the time,
-            # remove a reaction, and double check that the core remains connected
-            stateCopy = self.state.copy()
-
-            # if we hit the minimum overlap with the start, don't remove any more
-            # reactions that overlap with start
-            currentOverlapLength = len(self.startSet.intersection(self.state))
-            overlapWithStart = currentOverlapLength / len(self.startSet)
-            if overlapWithStart <= self.minOverlapWithStart:
-                stateCopy.difference_update(self.startSet)
-                
-            # randomize the set of reactions to potentially remove
-            stateList = list(stateCopy)
-            np.random.shuffle(stateList)
-                
-            for reactionName in stateList:
-                tempState = self.state.copy()
-                tempState.remove(reactionName)
-                connected = findSubsetConnectedToFeed(
-                    tempState,
-                    self.feed,
-                    self.currencyMetabolites,
-                    self.model,
-                    )
-                if len(connected) == len(tempState):
-                    self.state = connected
-                    break
+            self.logFile.write(str(E) + ',' + str(len(self.state)) + '\n')
+        if self.trace:
+            self.trace.record(step, T, proposed_E, E, len(self.state),
+                self.lastMove, accepted)
+
+    def anneal_iter(self, seed=None, resume=None, every=1):
+        # flush the logfile and trace however annealing ends, including
+        # through anneal(), which runs this generator
+        try:
+            yield from super(OptimalCoreProblem, self).anneal_iter(
+                seed, resume, every)
+        finally:
+            if self.logFile:
+                self.logFile.flush()
+            if self.trace:
+                self.trace.flush()
+
+    def state_diff(self, previous, current):
+        # reaction names added to and removed from the core, in model order
+
+        reactionIds = self.engine.index.reactionIds
+        return (
+            [reactionIds[i] for i in np.flatnonzero(
+                current.mask & ~previous.mask)],
+            [reactionIds[i] for i in np.flatnonzero(
+                previous.mask & ~current.mask)],
+            )
+
+    def pack_state(self, state):
+        # store checkpointed states as packed bits over the model reactions
+        return np.packbits(state.mask)
+
+    def unpack_state(self, packed):
+        index = self.engine.index
+        mask = np.unpackbits(packed)[:len(index.reactionIds)].astype(bool)
+        return CoreState(index.reactionIds, index.reactionIndex, mask)
+
+    def copy_state(self, state):
+        with self.timer.phase('copy_state'):
+            return super(OptimalCoreProblem, self).copy_state(state)
+
+    def findConnected(self, state):
+        # find the subset of a core state connected to the feed
+
+        index = self.engine.index
+        connected = findSubsetConnectedToFeedIndexed(
+            index.reactionMask(state),
+            index.reactionIndex[self.feed],
+            index,
+            )
+        return index.reactionNames(connected)
+
+    def findRemovable(self, state):
+        # find all reactions in a core state which can be removed without
+        # disconnecting any other reaction from the feed, as a bool mask
+
+        index = self.engine.index
+        return findRemovableReactionsIndexed(
+            index.reactionMask(state),
+            index.reactionIndex[self.feed],
+            index,
+            )
 
     def energy(self):
         # calculate the score
 
-        fluxIntoCore, self.producingFluxes, self.consumingFluxes = \
-            limitFluxToCore(
-                self.state, 
-                self.model, 
-                self.currencyMetabolites, 
-                False,
-                )
+        with self.timer.phase('energy'):
+            key = self.energyCache.key(self.state)
+            result = self.energyCache.get(key)
+            if result is None:
+                result = self.engine.evaluate(self.state, compact=True)
+                self.energyCache.put(key, result)
+            self.result = result
+            self.resultKey = key
+        return result.fluxIntoCore
 
-        return fluxIntoCore
+    def timings(self):
+        """Returns the time spent per phase as a pandas DataFrame.
+
+        Only available if a lftc.PhaseTimer was given as timer.
+        """
+        return self.timer.asDataFrame()
+
+    @property
+    def producingFluxes(self):
+        # producing fluxes of the last scored core
+        return self.result.producingFluxes
+
+    @property
+    def consumingFluxes(self):
+        # consuming fluxes of the last scored core
+        return self.result.consumingFluxes
 
     def prune(self):
         # Removes any individual newly added reactions which don't
         # reduce total energy into the core. This reverses the addition
         # of unnecessary individual reactions, however it does not
         # combinatorially test removing multiple reactions simultaneously.
+        # See lftc.pruneBatch() to prune in parallel.
 
-        newReactions = self.state.difference(self.startSet)
+        newReactions = [r for r in self.state if r not in self.startSet]
+        removable = self.findRemovable(self.state)
+        currentEnergy = self.energy()
 
         for newReaction in newReactions:
-            oldState = self.state.copy()
+            # only try removing reactions which leave the core connected
+            if not removable[self.engine.index.reactionIndex[newReaction]]:
+                continue
 
-            # try removing a reaction and test if the core is still connected
-            tempState = self.state.copy()
-            tempState.remove(newReaction)
-            connected = findSubsetConnectedToFeed(
-                tempState,
-                self.feed,
-                self.currencyMetabolites,
-                self.model,
-                )
-
-            # if core is still connected, check the new energy
-            if len(connected) == len(tempState):
-                currentEnergy = self.energy()
-                self.state = connected
-                newEnergy = self.energy()
-
-                # if new energy is worse, go back to the old solution
-                # otherwise keep it
-                if newEnergy > currentEnergy:
-                    self.state = oldState
+            # check the new energy
+            oldState = self.state.copy()
+            self.state.remove(newReaction)
+            newEnergy = self.energy()
+
+            # if new energy is worse, go back to the old solution
+            # otherwise keep it, and find what can now be removed
+            if self.energy_key(newEnergy) > self.energy_key(currentEnergy):
+                self.state = oldState
+            else:
+                currentEnergy = newEnergy
+                removable = self.findRemovable(self.state)
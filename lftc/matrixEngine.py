@@ -0,0 +1,101 @@
+"""
+Linear programming engine which solves limit flux to core directly on the
+stoichiometric matrix, without going through COBRApy or optlang
+
+By Tyler W. H. Backman
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from cobra.exceptions import OptimizationError
+from scipy.optimize import linprog
+from .compactModel import modelBounds, modelIndex
+from .engine import FluxEngine
+
+
+def splitBounds(bounds):
+    """Returns the bounds of the forward then reverse variable of each
+    reaction, as COBRApy splits them, as two numpy arrays, from the lower
+    and upper bound of each reaction with one row per reaction."""
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    return (
+        np.concatenate((np.maximum(lower, 0), np.maximum(-upper, 0))),
+        np.concatenate((np.maximum(upper, 0), np.maximum(-lower, 0))),
+        )
+
+
+class MatrixFluxEngine(FluxEngine):
+
+    def __init__(self, model, currencyMetabolites, timer=None):
+        """Matrix limit flux to core solver.
+
+        Extracts the stoichiometric matrix and reaction bounds of a model
+        once into SciPy sparse arrays, and scores cores by solving the same
+        minimization as lftc.engine.CoreFluxEngine with the HiGHS solver
+        bundled with SciPy. As in COBRApy, each reaction is split into a
+        forward and a reverse variable, so results are equivalent. Each
+        solve starts from scratch, so the engine pays off when it is kept
+        and scores many cores.
+
+        Only the mass balance and reaction bounds of the model are used,
+        so any other constraints added to the model's solver are ignored.
+        The model is read but never modified, and later changes to it are
+        not seen by the engine.
+
+        Args:
+            model (cobra.core.model.Model): A COBRApy genome scale model,
+                or a lftc.CompactModel, whose precomputed index is reused.
+            currencyMetabolites (set): A set of metabolites to exclude
+                when identifying reactions which feed carbon into the core.
+            timer (lftc.PhaseTimer): Optional, times the boundary, objective,
+                solve and extract phases of each evaluation.
+        """
+        super(MatrixFluxEngine, self).__init__(
+            modelIndex(model, currencyMetabolites), currencyMetabolites, timer)
+        nReactions = len(self.index.reactionIds)
+
+        # mass balance over forward then reverse variables
+        stoichiometryT = self.index.stoichiometry.T.tocsr()
+        self.equalities = sp.hstack(
+            [stoichiometryT, -stoichiometryT], format='csr')
+        self.rightHandSide = np.zeros(len(self.index.metaboliteIds))
+
+        self.bounds = np.column_stack(splitBounds(modelBounds(model)))
+        self.objective = np.zeros(2 * nReactions)
+        self.fluxes = np.zeros(nReactions)
+
+    def _updateObjective(self, addedProducing, removedProducing,
+        addedConsuming, removedConsuming):
+        # forward variables come first, then reverse variables
+        nReactions = len(self.index.reactionIds)
+        objective = self.objective
+        objective[removedProducing] = 0
+        objective[addedProducing] = 1
+        objective[nReactions + np.array(removedConsuming, dtype=int)] = 0
+        objective[nReactions + np.array(addedConsuming, dtype=int)] = 1
+
+    def _solve(self):
+        nReactions = len(self.index.reactionIds)
+        solution = linprog(
+            self.objective,
+            A_eq=self.equalities,
+            b_eq=self.rightHandSide,
+            bounds=self.bounds,
+            method='highs',
+            )
+        if solution.status != 0:
+            raise OptimizationError(
+                'limit flux to core failed: ' + solution.message)
+        self.fluxes = solution.x[:nReactions] - solution.x[nReactions:]
+
+    def _setReactionBounds(self, reactionIndices, bounds):
+        nReactions = len(self.index.reactionIds)
+        lower, upper = splitBounds(bounds)
+        variables = np.concatenate(
+            (reactionIndices, nReactions + reactionIndices))
+        self.bounds[variables, 0] = lower
+        self.bounds[variables, 1] = upper
+
+    def netFluxes(self, reactionIndices):
+        """Returns the fluxes of the last solve for reaction positions."""
+        return self.fluxes[np.asarray(reactionIndices, dtype=np.int64)]
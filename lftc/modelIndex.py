@@ -0,0 +1,184 @@
+"""
+Integer indexed sparse view of a genome scale model, built once so that
+graph queries don't need to walk COBRApy objects
+
+By Tyler W. H. Backman
+"""
+
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+from .coreState import CoreState
+
+
+class ModelIndex(object):
+
+    def __init__(
+        self,
+        reactionIds,
+        metaboliteIds,
+        stoichiometry,
+        reversible,
+        currency,
+        ):
+        """Sparse reaction-metabolite incidence index.
+
+        Reactions and metabolites are numbered by their position in
+        reactionIds and metaboliteIds. Sets of reactions or metabolites
+        are represented as numpy bool masks over these positions.
+
+        Args:
+            reactionIds (list): Reaction names of type str.
+            metaboliteIds (list): Metabolite names of type str.
+            stoichiometry (scipy.sparse.spmatrix): A reactions by metabolites
+                matrix of stoichiometric coefficients. Negative entries are
+                consumed (reactants), positive entries are produced (products).
+            reversible (numpy.ndarray): A bool mask of reversible reactions.
+            currency (numpy.ndarray): A bool mask of currency metabolites,
+                which are ignored when connecting reactions.
+        """
+        self.reactionIds = list(reactionIds)
+        self.metaboliteIds = list(metaboliteIds)
+        self.reactionIndex = {r: i for i, r in enumerate(self.reactionIds)}
+        self.metaboliteIndex = {m: i for i, m in enumerate(self.metaboliteIds)}
+        self.reversible = np.asarray(reversible, dtype=bool)
+        self.currency = np.asarray(currency, dtype=bool)
+        assert len(self.reversible) == len(self.reactionIds)
+        assert len(self.currency) == len(self.metaboliteIds)
+
+        # signed incidence in both row (reaction) and column (metabolite)
+        # major order
+        self.stoichiometry = sp.csr_matrix(stoichiometry, dtype=float)
+        assert self.stoichiometry.shape == \
+            (len(self.reactionIds), len(self.metaboliteIds))
+        sign = self.stoichiometry.sign().astype(np.int8)
+        self.reactants = (sign < 0).astype(np.int8).tocsr()
+        self.products = (sign > 0).astype(np.int8).tocsr()
+        self.reactantsT = self.reactants.T.tocsr()
+        self.productsT = self.products.T.tocsr()
+
+        # all non-currency metabolites participating in each reaction
+        notCurrency = sp.diags((~self.currency).astype(np.int8), dtype=np.int8)
+        self.adjacency = (self.reactants + self.products).dot(notCurrency).tocsr()
+        self.adjacency.eliminate_zeros()
+        self.adjacencyT = self.adjacency.T.tocsr()
+
+    @classmethod
+    def fromModel(cls, model, currencyMetabolites=set()):
+        """Build an index from a COBRApy model.
+
+        Reversibility is taken from the reaction bounds at the time the
+        index is built.
+
+        Args:
+            model (cobra.core.model.Model): A COBRApy genome scale model.
+            currencyMetabolites (set): Optional, a set of metabolite names
+                to mark as currency.
+
+        Returns:
+            index (lftc.modelIndex.ModelIndex): The index.
+        """
+        metaboliteIds = [m.id for m in model.metabolites]
+        metaboliteIndex = {m: i for i, m in enumerate(metaboliteIds)}
+        rows, columns, values = [], [], []
+        for i, reaction in enumerate(model.reactions):
+            for metabolite, coefficient in reaction.metabolites.items():
+                rows.append(i)
+                columns.append(metaboliteIndex[metabolite.id])
+                values.append(coefficient)
+        stoichiometry = sp.coo_matrix(
+            (values, (rows, columns)),
+            shape=(len(model.reactions), len(metaboliteIds)),
+            )
+        return cls(
+            [r.id for r in model.reactions],
+            metaboliteIds,
+            stoichiometry,
+            [r.reversibility for r in model.reactions],
+            [m in currencyMetabolites for m in metaboliteIds],
+            )
+
+    # sparse matrices written by save(), which are not rebuilt by load()
+    _matrices = ('stoichiometry', 'reactants', 'products', 'reactantsT',
+                 'productsT', 'adjacency', 'adjacencyT')
+
+    def save(self, directory):
+        """Write the index to a directory of .npy files, one per array."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in self._matrices:
+            matrix = getattr(self, name)
+            for part in ('data', 'indices', 'indptr'):
+                np.save(os.path.join(directory, name + '.' + part + '.npy'),
+                    getattr(matrix, part))
+        np.save(os.path.join(directory, 'reversible.npy'), self.reversible)
+        np.save(os.path.join(directory, 'currency.npy'), self.currency)
+        with open(os.path.join(directory, 'ids.json'), 'w') as f:
+            json.dump({'reactionIds': self.reactionIds,
+                       'metaboliteIds': self.metaboliteIds}, f)
+
+    @classmethod
+    def load(cls, directory, mmapMode='r'):
+        """Read an index written by save(), without rebuilding it.
+
+        Args:
+            directory (str): The directory written by save().
+            mmapMode (str): Optional, the numpy mmap_mode of the arrays.
+                The default of 'r' maps them read only, so that processes
+                loading the same index share its memory. Use None to read
+                them into memory.
+
+        Returns:
+            index (lftc.modelIndex.ModelIndex): The index.
+        """
+        def array(name):
+            return np.load(os.path.join(directory, name + '.npy'),
+                mmap_mode=mmapMode)
+
+        with open(os.path.join(directory, 'ids.json')) as f:
+            ids = json.load(f)
+        index = cls.__new__(cls)
+        index.reactionIds = ids['reactionIds']
+        index.metaboliteIds = ids['metaboliteIds']
+        index.reactionIndex = {r: i for i, r in enumerate(index.reactionIds)}
+        index.metaboliteIndex = \
+            {m: i for i, m in enumerate(index.metaboliteIds)}
+        index.reversible = array('reversible')
+        index.currency = array('currency')
+        nReactions = len(index.reactionIds)
+        nMetabolites = len(index.metaboliteIds)
+        for name in cls._matrices:
+            shape = (nMetabolites, nReactions) if name.endswith('T') \
+                else (nReactions, nMetabolites)
+            setattr(index, name, sp.csr_matrix((array(name + '.data'),
+                array(name + '.indices'), array(name + '.indptr')),
+                shape=shape, copy=False))
+        return index
+
+    def reactionMask(self, reactionNames):
+        """Returns a bool mask over reactions for a collection of names.
+
+        For a CoreState created from this index, its own mask is returned
+        without copying, so it must not be modified.
+        """
+        if isinstance(reactionNames, CoreState) and \
+            reactionNames.reactionIds is self.reactionIds:
+            return reactionNames.mask
+        mask = np.zeros(len(self.reactionIds), dtype=bool)
+        mask[[self.reactionIndex[r] for r in reactionNames]] = True
+        return mask
+
+    def reactionNames(self, mask):
+        """Returns the set of reaction names for a bool mask."""
+        return {self.reactionIds[i] for i in np.flatnonzero(mask)}
+
+    def metaboliteMask(self, metaboliteNames):
+        """Returns a bool mask over metabolites for a collection of names."""
+        mask = np.zeros(len(self.metaboliteIds), dtype=bool)
+        mask[[self.metaboliteIndex[m] for m in metaboliteNames]] = True
+        return mask
+
+    def metaboliteNames(self, mask):
+        """Returns the set of metabolite names for a bool mask."""
+        return {self.metaboliteIds[i] for i in np.flatnonzero(mask)}
@@ -0,0 +1,758 @@
+"""
+Functions for running lftc across a pool of worker processes. Each worker
+loads the model once, and keeps one OptimalCoreProblem which is reused
+by every task sent to it.
+
+By Tyler W. H. Backman
+"""
+
+import functools
+import json
+import math
+import multiprocessing
+import os
+import time
+import cobra
+from cobra.exceptions import OptimizationError
+import numpy as np
+import pandas as pd
+from .anneal import round_figures
+from .compactModel import CompactModel, modelBounds, modelReactionIds
+from .coreState import CoreState
+from .engine import SweepResult
+from .fingerprint import fingerprint
+from .lftc import OptimalCoreProblem, currencyMetabolites, fluxEngines, \
+    _resolveBackend
+
+# the problem or engine of this worker process, set by _initWorker() in
+# pool workers only, so streams run in the calling process never share it
+_worker = {}
+
+def _readModel(model):
+    # read a model given as the path of a compact model directory or SBML
+
+    if not isinstance(model, str):
+        return model
+    if CompactModel.isCompactModel(model):
+        return CompactModel.load(model)
+    return cobra.io.read_sbml_model(model)
+
+def _problemWorker(model, state, feed, problemArgs):
+    # build the problem of a worker, reading the model if given a path
+
+    model = _readModel(model)
+    return {'problem': OptimalCoreProblem(
+        state=set(state),
+        model=model,
+        feed=feed,
+        **problemArgs
+        )}
+
+def _engineWorker(model, currencyMetabolites, backend):
+    # build the engine of a worker, reading the model if given a path
+
+    model = _readModel(model)
+    return {'engine': fluxEngines[backend](model, currencyMetabolites)}
+
+def _sweepWorker(model, currencyMetabolites, backend, core):
+    # build the engine of a worker, and remember the model bounds which
+    # conditions override
+
+    model = _readModel(model)
+    worker = _engineWorker(model, currencyMetabolites, backend)
+    worker['core'] = core
+    worker['bounds'] = modelBounds(model)
+    worker['overridden'] = np.zeros(0, dtype=np.int64)
+    return worker
+
+def _initWorker(builder, *args):
+    # pool initializer, which builds the state of this worker process
+
+    _worker.clear()
+    _worker.update(builder(*args))
+
+def _runTask(function, task):
+    # run a task on the state of this worker process
+    return function(_worker, task)
+
+def _sweepCondition(worker, task):
+    # score the core of a worker under the bound overrides of one
+    # condition, restoring the bounds overridden by its previous condition
+
+    i, reactionNames, bounds = task
+    engine = worker['engine']
+    baseBounds = worker['bounds']
+    reactionIndices = np.array(
+        [engine.index.reactionIndex[r] for r in reactionNames], dtype=np.int64)
+    bounds = np.where(np.isnan(bounds), baseBounds[reactionIndices], bounds)
+    restore = np.setdiff1d(worker['overridden'], reactionIndices)
+    engine.setBounds(
+        np.concatenate((restore, reactionIndices)),
+        np.concatenate((baseBounds[restore], bounds)))
+    worker['overridden'] = reactionIndices
+    try:
+        result = engine.evaluate(worker['core'], compact=True)
+    except OptimizationError:
+        return i, None
+    return i, (result.fluxIntoCore, result.producingIndices,
+        result.producingValues, result.consumingIndices,
+        result.consumingValues)
+
+def _evaluateCore(worker, task):
+    # score one core with the engine of a worker
+
+    i, coreReactionNames = task
+    return (i,) + worker['engine'].evaluate(coreReactionNames)
+
+def _scoreCore(worker, task):
+    # energy of one core, sent as packed bits over the model reactions
+
+    i, packed = task
+    engine = worker['engine']
+    index = engine.index
+    mask = np.unpackbits(packed)[:len(index.reactionIds)].astype(bool)
+    result = engine.evaluate(
+        CoreState(index.reactionIds, index.reactionIndex, mask), compact=True)
+    return i, result.fluxIntoCore
+
+def _annealSegment(worker, task):
+    # anneal one chain over part of the temperature schedule
+
+    chain, state, schedule, seed = task
+    ocp = worker['problem']
+    ocp.state = CoreState.fromSet(state, ocp.engine.index)
+    ocp.user_exit = False
+    ocp.set_schedule(schedule)
+    bestState, bestEnergy = ocp.anneal(seed=seed)
+    return chain, bestState.toSet(), bestEnergy
+
+def _startWorkers(processes, builder, builderArgs):
+    # start a pool of workers, or if processes is 1 build the state of a
+    # single worker in this process, which only this call holds
+
+    if processes == 1:
+        return builder(*builderArgs)
+    return multiprocessing.Pool(
+        processes=processes,
+        initializer=_initWorker,
+        initargs=(builder,) + tuple(builderArgs),
+        )
+
+def _mapTasks(pool, function, tasks, chunksize=1):
+    # lazily run tasks on the workers from _startWorkers, in order
+
+    if isinstance(pool, dict):
+        return map(functools.partial(function, pool), tasks)
+    return pool.imap(functools.partial(_runTask, function), tasks, chunksize)
+
+def _scoreCores(problem, pool, cores, chunksize):
+    # energies of CoreState objects, scored in this process with the engine
+    # and energy cache of problem, or on the engine workers of pool
+
+    if pool is None:
+        state = problem.state
+        energies = []
+        for core in cores:
+            problem.state = core
+            energies.append(problem.energy())
+        problem.state = state
+        return energies
+    tasks = ((i, np.packbits(core.mask)) for i, core in enumerate(cores))
+    return [energy for i, energy in
+        _mapTasks(pool, _scoreCore, tasks, chunksize)]
+
+def _stopWorkers(pool):
+    # stop the pool, or release the worker state built in this process
+
+    if isinstance(pool, dict):
+        pool.clear()
+    elif pool is not None:
+        pool.close()
+        pool.join()
+
+def iterLimitFluxToCore(
+    cores,
+    model,
+    currencyMetabolites=currencyMetabolites,
+    processes=1,
+    chunksize=8,
+    backend=None,
+    ):
+    """Stream limit flux to core results for many cores.
+
+    Scores each core like limitFluxToCore(), but reuses one incrementally
+    updated LP per worker instead of copying the model and building a new
+    LP for every core, so similar cores are cheapest to score in sequence.
+    The model is never modified.
+
+    Args:
+        cores (iterable): Sets of reaction names of type str, or
+            lftc.CoreState objects.
+        model (cobra.core.model.Model): A COBRApy genome scale model or
+            lftc.CompactModel, or the path of an SBML file or compact model
+            directory which each worker will read itself.
+        currencyMetabolites (set): Optional, a set of metabolites to exclude
+            when identifying reactions which feed carbon into the core.
+        processes (int): Optional, the number of worker processes. The
+            default of 1 scores all cores in this process.
+        chunksize (int): Optional, the number of cores sent to a worker at
+            once.
+        backend (str): Optional, the solver backend, 'cobra' or 'matrix',
+            as for limitFluxToCore(), which defaults to 'matrix' for compact
+            models.
+
+    Yields:
+        (tuple): tuple containing the position of the core in cores,
+            followed by the three values returned by limitFluxToCore().
+    """
+    assert type(currencyMetabolites) is set, 'currencyMetabolites is not a set'
+    backend = _resolveBackend(model, backend)
+    if processes == 1 and not isinstance(model, str) and backend == 'cobra':
+        model = model.copy()
+    pool = _startWorkers(
+        processes, _engineWorker, (model, currencyMetabolites, backend))
+    try:
+        for result in _mapTasks(
+            pool, _evaluateCore, enumerate(cores), chunksize):
+            yield result
+    finally:
+        _stopWorkers(pool)
+
+def limitFluxToCoreBatch(
+    cores,
+    model,
+    currencyMetabolites=currencyMetabolites,
+    processes=1,
+    chunksize=8,
+    backend=None,
+    ):
+    """Limit flux to core for many cores, as one tidy table.
+
+    See iterLimitFluxToCore() for the arguments.
+
+    Returns:
+        results (pandas.core.frame.DataFrame): One row per boundary reaction
+            of each core, with columns core (the position of the core in
+            cores), fluxIntoCore, reaction, boundary ('producing' or
+            'consuming') and flux.
+    """
+    tables = []
+    for i, fluxIntoCore, producingFluxes, consumingFluxes in \
+        iterLimitFluxToCore(
+            cores, model, currencyMetabolites, processes, chunksize,
+            backend):
+        for boundary, fluxes in (
+            ('producing', producingFluxes), ('consuming', consumingFluxes)):
+            tables.append(pd.DataFrame({
+                'core': i,
+                'fluxIntoCore': fluxIntoCore,
+                'reaction': fluxes.index,
+                'boundary': boundary,
+                'flux': fluxes.values,
+                }))
+    columns = ['core', 'fluxIntoCore', 'reaction', 'boundary', 'flux']
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tables, ignore_index=True)[columns]
+
+def limitFluxToCoreSweep(
+    core,
+    model,
+    conditions,
+    currencyMetabolites=currencyMetabolites,
+    processes=1,
+    chunksize=8,
+    backend=None,
+    ):
+    """Limit flux to core for one core under many conditions.
+
+    Scores a core like limitFluxToCore() under each condition, such as the
+    measured exchange fluxes of strains or timepoints, without copying the
+    model or building a new LP per condition. Each worker keeps one LP, and
+    between conditions only changes the bounds which differ, so with the
+    cobra backend each solve warm starts from the basis of the last one.
+    Consecutive conditions are sent to the same worker in blocks of
+    chunksize, so order similar conditions next to each other. The model
+    is never modified.
+
+    Args:
+        core (set): The set of reaction names of type str included in core,
+            or a lftc.CoreState.
+        model (cobra.core.model.Model): A COBRApy genome scale model or
+            lftc.CompactModel, or the path of an SBML file or compact model
+            directory which each worker will read itself.
+        conditions (pandas.core.frame.DataFrame): The reaction bound
+            overrides of each condition, with one row per condition and
+            reaction, and columns condition, reaction, lower and upper. A
+            nan lower or upper bound keeps that bound of the model, as do
+            reactions not listed for a condition. Conditions are scored in
+            order of first appearance.
+        currencyMetabolites (set): Optional, a set of metabolites to exclude
+            when identifying reactions which feed carbon into the core.
+        processes (int): Optional, the number of worker processes. The
+            default of 1 scores all conditions in this process.
+        chunksize (int): Optional, the number of conditions sent to a
+            worker at once.
+        backend (str): Optional, the solver backend, 'cobra' or 'matrix',
+            as for limitFluxToCore(), which defaults to 'matrix' for compact
+            models.
+
+    Returns:
+        results (lftc.SweepResult): The flux into core and boundary fluxes
+            of each condition, with a nan flux into core for infeasible
+            conditions.
+    """
+    assert type(core) in (set, CoreState), 'core is not a set'
+    assert isinstance(conditions, pd.DataFrame), \
+        'conditions is not a pandas DataFrame'
+    assert {'condition', 'reaction', 'lower', 'upper'}.issubset(
+        conditions.columns), 'conditions missing required columns'
+    assert not conditions.duplicated(['condition', 'reaction']).any(), \
+        'reaction bounds overridden twice in one condition'
+    assert type(currencyMetabolites) is set, 'currencyMetabolites is not a set'
+    backend = _resolveBackend(model, backend)
+
+    if processes == 1 or not isinstance(model, str):
+        model = _readModel(model)
+        reactionIds = modelReactionIds(model)
+        if processes == 1 and backend == 'cobra':
+            model = model.copy()
+    else:
+        reactionIds = modelReactionIds(_readModel(model))
+    core = set(core)
+    assert core.issubset(reactionIds), \
+        'some core reaction names missing from model'
+    assert set(conditions.reaction).issubset(reactionIds), \
+        'some condition reaction names missing from model'
+
+    names = []
+    tasks = []
+    for condition, rows in conditions.groupby('condition', sort=False):
+        tasks.append((len(names), tuple(rows.reaction), rows[['lower',
+            'upper']].to_numpy(dtype=float)))
+        names.append(condition)
+
+    nReactions = len(reactionIds)
+    fluxIntoCore = np.full(len(names), np.nan)
+    fluxes = np.zeros((len(names), nReactions))
+    producing = np.zeros((len(names), nReactions), dtype=bool)
+    consuming = np.zeros((len(names), nReactions), dtype=bool)
+
+    pool = _startWorkers(processes, _sweepWorker,
+        (model, currencyMetabolites, backend, core))
+    try:
+        for i, result in _mapTasks(pool, _sweepCondition, tasks, chunksize):
+            if result is None:
+                continue
+            fluxIntoCore[i], producingIndices, producingValues, \
+                consumingIndices, consumingValues = result
+            producing[i, producingIndices] = True
+            consuming[i, consumingIndices] = True
+            fluxes[i, producingIndices] = producingValues
+            fluxes[i, consumingIndices] = consumingValues
+    finally:
+        _stopWorkers(pool)
+    return SweepResult(names, reactionIds, fluxIntoCore, fluxes,
+        producing, consuming)
+
+def annealChains(
+    state,
+    model,
+    feed,
+    schedule,
+    seeds,
+    processes=None,
+    exchangeSteps=None,
+    migration='ring',
+    **problemArgs
+    ):
+    """Parallel multi-chain simulated annealing with best state exchange.
+
+    Runs one annealing chain per seed, following the same exponential
+    temperature schedule, across a pool of worker processes which each
+    load the model once. Every exchangeSteps steps all chains pause, and
+    exchange best states as an island model:
+
+    * ring: each chain continues from the best state of the previous chain
+      if that is better than its own best state.
+    * best: every chain continues from the best state of all chains.
+    * None: chains never exchange states, and only continue from their own
+      best state.
+
+    Args:
+        state (set): The set of reaction names of type str to set the
+            initial starting core state of every chain.
+        model (cobra.core.model.Model): A COBRApy genome scale model or
+            lftc.CompactModel, or the path of an SBML file or compact model
+            directory which each worker will read itself.
+        feed (str): The carbon uptake feed.
+        schedule (dict): An annealing schedule with keys tmax, tmin and
+            steps, as taken by OptimalCoreProblem.set_schedule().
+        seeds (list): One random seed of type int per chain.
+        processes (int): Optional, the number of worker processes. Defaults
+            to the number of CPUs, and 1 runs all chains in this process.
+        exchangeSteps (int): Optional, the number of steps between
+            exchanges. Defaults to never exchanging.
+        migration (str): Optional, 'ring', 'best' or None.
+        **problemArgs: Further arguments for OptimalCoreProblem, such as
+            minOverlapWithStart or excludeReactions.
+
+    Returns:
+        results (list): One (set, numpy.float64) tuple per seed, with the
+            best core found by that chain and its energy.
+    """
+    assert migration in ('ring', 'best', None), 'unknown migration'
+    assert len(seeds) > 0, 'at least one seed required'
+    steps = int(schedule['steps'])
+    if not exchangeSteps:
+        exchangeSteps = steps
+    assert exchangeSteps > 0
+    if processes is None:
+        processes = min(len(seeds), multiprocessing.cpu_count())
+
+    nChains = len(seeds)
+    tFactor = -math.log(schedule['tmax'] / schedule['tmin'])
+    starts = [set(state)] * nChains
+    best = [(None, float('inf'))] * nChains
+
+    pool = _startWorkers(
+        processes, _problemWorker, (model, set(state), feed, problemArgs))
+    try:
+        start = 0
+        epoch = 0
+        while start < steps:
+            stop = min(start + exchangeSteps, steps)
+
+            # this epoch covers part of the exponential temperature schedule
+            segment = {
+                'tmax': schedule['tmax'] * math.exp(tFactor * start / steps),
+                'tmin': schedule['tmax'] * math.exp(tFactor * stop / steps),
+                'steps': stop - start,
+                'updates': 0,
+                }
+            tasks = [(chain, starts[chain], segment,
+                      (seeds[chain] + 1000003 * epoch) % (2 ** 32 - 1) + 1)
+                     for chain in range(nChains)]
+            for chain, bestState, bestEnergy in list(_mapTasks(
+                pool, _annealSegment, tasks)):
+                if bestEnergy < best[chain][1]:
+                    best[chain] = (bestState, bestEnergy)
+
+            # exchange best states between chains
+            if migration == 'ring':
+                starts = [min(best[chain], best[chain - 1],
+                              key=lambda b: b[1])[0]
+                          for chain in range(nChains)]
+            elif migration == 'best':
+                starts = [min(best, key=lambda b: b[1])[0]] * nChains
+            else:
+                starts = [b[0] for b in best]
+
+            start = stop
+            epoch += 1
+    finally:
+        _stopWorkers(pool)
+
+    return best
+
+def localSearch(problem, processes=1, chunksize=8, maxSteps=None):
+    """Deterministic steepest descent core optimizer.
+
+    Starting from the current state of an OptimalCoreProblem, scores every
+    core one move away, adding any boundary reaction or removing any
+    reaction which leaves the core connected, and applies the move which
+    lowers the energy the most, until no move lowers it. Moves follow the
+    minOverlapWithStart, maxOverlapWithModel and excludeReactions of the
+    problem, and ties go to the first move in model order, additions
+    first. Can be used on its own, or after anneal() to polish its best
+    state.
+
+    Args:
+        problem (lftc.OptimalCoreProblem): The problem, whose state is
+            set to the result.
+        processes (int): Optional, the number of worker processes which
+            score the moves of each step. The default of 1 scores them in
+            this process, with the engine and energy cache of the problem.
+        chunksize (int): Optional, the number of cores sent to a worker at
+            once.
+        maxSteps (int): Optional, the maximum number of moves to apply.
+
+    Returns:
+        (tuple): tuple containing:
+            arg1 (lftc.CoreState): The best core found.
+            arg2 (numpy.float64): Its energy.
+    """
+    assert isinstance(problem, OptimalCoreProblem), \
+        'problem is not an OptimalCoreProblem'
+    index = problem.engine.index
+    pool = None
+    if processes != 1:
+        pool = _startWorkers(processes, _engineWorker,
+            (problem.model, problem.currencyMetabolites, problem.backend))
+
+    def moved(state, reactionIndex, add):
+        # a copy of state with one reaction added or removed
+        state = state.copy()
+        if add:
+            state.add(index.reactionIds[reactionIndex])
+        else:
+            state.remove(index.reactionIds[reactionIndex])
+        return state
+
+    try:
+        state = problem.state.copy()
+        energy = problem.energy()
+        steps = 0
+        while maxSteps is None or steps < maxSteps:
+            additions, removals = problem.moveCandidates()
+            moves = [(r, True) for r in additions] + \
+                [(r, False) for r in removals]
+            if not moves:
+                break
+
+            energies = _scoreCores(problem, pool,
+                (moved(state, r, add) for r, add in moves), chunksize)
+
+            keys = [problem.energy_key(e) for e in energies]
+            best = int(np.argmin(keys))
+            if keys[best] >= problem.energy_key(energy):
+                break
+            state = moved(state, *moves[best])
+            energy = energies[best]
+            problem.state = state.copy()
+            steps += 1
+    finally:
+        _stopWorkers(pool)
+
+    problem.state = state.copy()
+    return state, energy
+
+def pruneBatch(problem, states=None, processes=1, chunksize=8):
+    """Remove newly added reactions which don't increase the energy.
+
+    Like OptimalCoreProblem.prune(), but scores the removal of every
+    reaction not in the start state which leaves the core connected as one
+    batch, against a single baseline energy, across worker processes.
+    Removals which don't increase the energy are accepted in order of
+    benefit: the best is applied, and only the other non-worsening
+    candidates which still leave the core connected are scored again
+    against the new core. Candidates which worsened or disconnected an
+    earlier core are only checked again once those run out, so that no
+    single removal of a new reaction can lower the energy of the result.
+
+    Args:
+        problem (lftc.OptimalCoreProblem): The problem, which sets the start
+            state and feed.
+        states (list): Optional, the cores to prune, as sets of reaction
+            names of type str or lftc.CoreState objects, such as the results
+            of annealChains(). Defaults to the current state of the problem,
+            which is then set to the result.
+        processes (int): Optional, the number of worker processes, which
+            are shared by all states. The default of 1 scores cores in this
+            process, with the engine and energy cache of the problem.
+        chunksize (int): Optional, the number of cores sent to a worker at
+            once.
+
+    Returns:
+        results (list): One (lftc.CoreState, numpy.float64) tuple per state,
+            with the pruned core and its energy.
+    """
+    assert isinstance(problem, OptimalCoreProblem), \
+        'problem is not an OptimalCoreProblem'
+    index = problem.engine.index
+    useProblemState = states is None
+    if useProblemState:
+        states = [problem.state]
+    pool = None
+    if processes != 1:
+        pool = _startWorkers(processes, _engineWorker,
+            (problem.model, problem.currencyMetabolites, problem.backend))
+
+    def removed(state, reactionIndex):
+        # a copy of state without one reaction
+        state = state.copy()
+        state.remove(index.reactionIds[reactionIndex])
+        return state
+
+    results = []
+    try:
+        for state in states:
+            state = CoreState.fromSet(state, index)
+            energy = _scoreCores(problem, None, [state], chunksize)[0]
+            newReactions = [index.reactionIndex[r] for r in state
+                if r not in problem.startSet]
+
+            # the number of removals accepted when each candidate was last
+            # checked, to find those checked against an earlier core
+            checked = {}
+            accepted = 0
+            candidates = newReactions
+            while True:
+                if not candidates:
+                    candidates = [r for r in newReactions if state.mask[r]
+                        and checked.get(r) != accepted]
+                    if not candidates:
+                        break
+                removable = problem.findRemovable(state)
+                checked.update((r, accepted) for r in candidates)
+                candidates = [r for r in candidates if removable[r]]
+                energies = _scoreCores(problem, pool,
+                    (removed(state, r) for r in candidates), chunksize)
+                improving = sorted((problem.energy_key(e), r, e) for e, r in
+                    zip(energies, candidates)
+                    if problem.energy_key(e) <= problem.energy_key(energy))
+                if improving:
+                    key, best, energy = improving[0]
+                    state = removed(state, best)
+                    accepted += 1
+                    candidates = [r for key, r, e in improving[1:]]
+                else:
+                    candidates = []
+            results.append((state, energy))
+    finally:
+        _stopWorkers(pool)
+
+    if useProblemState:
+        problem.state = results[0][0].copy()
+    return results
+
+def _temperatureForAcceptance(deltas, acceptance):
+    # the temperature at which moves with these energy deltas are accepted
+    # with this mean probability, by bisection on log temperature
+
+    uphill = deltas[deltas > 0]
+    low = math.log(uphill.min() / -math.log(acceptance))
+    high = math.log(uphill.max() / -math.log(acceptance))
+    def meanAcceptance(logT):
+        return (len(deltas) - len(uphill) +
+            np.exp(-uphill / math.exp(logT)).sum()) / len(deltas)
+    if meanAcceptance(low) >= acceptance:
+        return math.exp(low)
+    for _ in range(100):
+        middle = (low + high) / 2
+        if meanAcceptance(middle) < acceptance:
+            low = middle
+        else:
+            high = middle
+    return math.exp(high)
+
+def estimateSchedule(
+    problem,
+    minutes,
+    samples=200,
+    processes=1,
+    chunksize=8,
+    seed=None,
+    startAcceptance=0.98,
+    endAcceptance=0.001,
+    cacheDir=None,
+    ):
+    """Estimate an annealing schedule from sampled energy deltas.
+
+    A cheaper alternative to Annealer.auto(), which scores a fixed budget
+    of random moves from the current state of the problem instead of
+    annealing at trial temperatures. Tmax is the temperature at which the
+    sampled moves are accepted with a mean probability of startAcceptance,
+    as auto() aims for, and Tmin the temperature at which the smallest
+    sampled uphill move is accepted with probability endAcceptance. Moves
+    to the same core are only scored once. The number of steps is set
+    from the time taken to score a core in this process, which is about
+    the time of an annealing step, to anneal for about the given number
+    of minutes.
+
+    Args:
+        problem (lftc.OptimalCoreProblem): The problem, whose state is
+            left unchanged.
+        minutes (float): The approximate duration of the annealing run.
+        samples (int): Optional, the number of random moves to score.
+        processes (int): Optional, the number of worker processes which
+            score the moves. The default of 1 scores them in this process.
+        chunksize (int): Optional, the number of cores sent to a worker at
+            once.
+        seed (int): Optional, the random seed for the moves.
+        startAcceptance (float): Optional, the mean acceptance of moves at
+            Tmax.
+        endAcceptance (float): Optional, the acceptance of the smallest
+            uphill move at Tmin.
+        cacheDir (str): Optional, a directory in which to save the
+            schedule, keyed by problem.fingerprint(), the current state of
+            problem, which moves are sampled from, and the arguments above,
+            except processes and chunksize. If the same schedule was
+            estimated before, it is read back instead of sampling again.
+
+    Returns:
+        schedule (dict): A schedule with keys tmax, tmin, steps and
+            updates, to pass to problem.set_schedule().
+    """
+    assert isinstance(problem, OptimalCoreProblem), \
+        'problem is not an OptimalCoreProblem'
+    assert samples > 0, 'at least one sample required'
+    assert 0 < endAcceptance < startAcceptance < 1
+
+    if cacheDir:
+        key = fingerprint(problem.fingerprint(),
+            np.packbits(problem.state.mask), float(minutes), int(samples),
+            seed, float(startAcceptance), float(endAcceptance))
+        cacheFile = os.path.join(cacheDir, 'schedule-' + key + '.json')
+        if os.path.exists(cacheFile):
+            with open(cacheFile) as f:
+                return json.load(f)
+
+    if seed:
+        np.random.seed(seed)
+
+    # propose random moves from the current state
+    state = problem.state.copy()
+    energy = problem.energy()
+    cores = {}
+    moves = []
+    for _ in range(samples):
+        problem.move()
+        key = problem.energyCache.key(problem.state)
+        cores.setdefault(key, problem.state)
+        moves.append(key)
+        problem.state = state.copy()
+
+    # time solving the first cores in this process, bypassing the energy
+    # cache, as an annealing step would
+    toScore = list(cores.values())
+    timed = min(len(toScore), 10)
+    start = time.time()
+    scored = [problem.engine.evaluate(core, compact=True).fluxIntoCore
+        for core in toScore[:timed]]
+    secondsPerStep = (time.time() - start) / timed
+
+    pool = None
+    if processes != 1 and len(toScore) > timed:
+        pool = _startWorkers(processes, _engineWorker,
+            (problem.model, problem.currencyMetabolites, problem.backend))
+    try:
+        scored += _scoreCores(problem, pool, toScore[timed:], chunksize)
+    finally:
+        _stopWorkers(pool)
+    energies = dict(zip(cores, scored))
+    problem.state = state
+
+    # ignore differences within solver tolerance
+    deltas = np.array([energies[key] for key in moves]) - energy
+    deltas[np.abs(deltas) <= 1e-6] = 0
+    uphill = deltas[deltas > 0]
+    assert len(uphill) > 0, 'no uphill moves sampled, increase samples'
+    tmax = round_figures(_temperatureForAcceptance(deltas, startAcceptance), 2)
+    tmin = round_figures(uphill.min() / -math.log(endAcceptance), 2)
+
+    schedule = {
+        'tmax': float(tmax),
+        'tmin': float(min(tmin, tmax)),
+        'steps': int(round_figures(int(60.0 * minutes / secondsPerStep), 2)),
+        'updates': problem.updates,
+        }
+
+    if cacheDir:
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        tmp = cacheFile + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(schedule, f)
+        os.replace(tmp, cacheFile)
+    return schedule
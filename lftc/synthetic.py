@@ -0,0 +1,147 @@
+"""
+Generator of reproducible synthetic metabolic networks, for measuring how
+lftc scales with model size
+
+By Tyler W. H. Backman
+"""
+
+import cobra
+import numpy as np
+
+def makeSyntheticModel(
+    nReactions=5000,
+    nMetabolites=3000,
+    reversibleFraction=0.3,
+    nCurrency=20,
+    currencyFraction=0.3,
+    coreSize=100,
+    feedUptake=10.0,
+    growthFraction=0.5,
+    seed=1,
+    ):
+    """Generate a feasible synthetic genome scale model.
+
+    Builds a network which always grows on its feed: a random tree of
+    reactions makes every metabolite from the feed, and the remaining
+    reactions randomly convert one or two substrates to as many products.
+    Currency (hub) metabolites take part in a fraction of reactions, and can
+    be freely exchanged with the environment. The core is the biomass
+    reaction and the subtree of reactions nearest the feed, including the
+    feed exchange and transport. Biomass draws on metabolites both inside
+    and outside of the core, so the core has a non zero flux into it which
+    annealing can reduce. The same arguments always give the same model.
+
+    Args:
+        nReactions (int): Optional, the total number of reactions.
+        nMetabolites (int): Optional, the total number of metabolites,
+            including currency metabolites and the extracellular feed.
+        reversibleFraction (float): Optional, the fraction of internal
+            reactions which are reversible.
+        nCurrency (int): Optional, the number of currency metabolites.
+        currencyFraction (float): Optional, the fraction of internal
+            reactions which also convert one currency metabolite to another.
+        coreSize (int): Optional, the number of reactions in the core,
+            including biomass.
+        feedUptake (float): Optional, the fixed uptake rate of the feed.
+        growthFraction (float): Optional, the biomass lower bound as a
+            fraction of the maximum growth rate.
+        seed (int): Optional, the random seed.
+
+    Returns:
+        (tuple): tuple containing:
+            arg1 (cobra.core.model.Model): The synthetic model, with biomass
+                as objective.
+            arg2 (str): The name of the feed exchange reaction.
+            arg3 (set): The reaction names of type str in the core, which
+                are connected to the feed.
+            arg4 (set): The currency metabolite names of type str, to pass
+                as currencyMetabolites.
+    """
+
+    # sanity check inputs
+    nInternal = nMetabolites - nCurrency - 1
+    nFixed = nInternal + nCurrency + 2
+    assert nCurrency >= 2 or currencyFraction == 0, \
+        'at least two currency metabolites required'
+    assert nInternal >= 4, 'nMetabolites too small for nCurrency'
+    assert nReactions >= nFixed, \
+        'nReactions must be at least ' + str(nFixed) + ' for these metabolites'
+    assert 0 <= reversibleFraction <= 1
+    assert 0 <= currencyFraction <= 1
+    assert 4 <= coreSize <= nInternal + 2, 'invalid coreSize'
+    assert feedUptake > 0
+    assert 0 <= growthFraction < 1
+
+    random = np.random.RandomState(seed)
+    model = cobra.Model('synthetic_' + str(seed))
+
+    # metabolites
+    feedMetabolite = cobra.Metabolite('feed_e', compartment='e')
+    internal = [cobra.Metabolite('m' + str(i) + '_c', compartment='c')
+                for i in range(nInternal)]
+    currency = [cobra.Metabolite('hub' + str(i) + '_c', compartment='c')
+                for i in range(nCurrency)]
+    model.add_metabolites([feedMetabolite] + internal + currency)
+
+    def internalReaction(name, stoichiometry):
+        # reaction with random reversibility, which may convert currency
+        reaction = cobra.Reaction(name)
+        reaction.lower_bound = -1000 \
+            if random.random_sample() < reversibleFraction else 0
+        reaction.upper_bound = 1000
+        if nCurrency and random.random_sample() < currencyFraction:
+            hubIn, hubOut = random.choice(nCurrency, 2, replace=False)
+            stoichiometry[currency[hubIn]] = -1
+            stoichiometry[currency[hubOut]] = 1
+        reaction.add_metabolites(stoichiometry)
+        return reaction
+
+    # feed exchange and transport
+    feedExchange = cobra.Reaction('EX_feed_e', lower_bound=-feedUptake,
+        upper_bound=-feedUptake)
+    feedExchange.add_metabolites({feedMetabolite: -1})
+    feedTransport = cobra.Reaction('FEEDt', lower_bound=0, upper_bound=1000)
+    feedTransport.add_metabolites({feedMetabolite: -1, internal[0]: 1})
+    reactions = [feedExchange, feedTransport]
+
+    # a tree making every internal metabolite from one made before it
+    for i in range(1, nInternal):
+        parent = random.randint(i)
+        reactions.append(internalReaction(
+            'T' + str(i), {internal[parent]: -1, internal[i]: 1}))
+    core = {r.id for r in reactions[:coreSize - 1]}
+
+    # free exchange of currency metabolites
+    for metabolite in currency:
+        reaction = cobra.Reaction('EX_' + metabolite.id, lower_bound=-1000,
+            upper_bound=1000)
+        reaction.add_metabolites({metabolite: -1})
+        reactions.append(reaction)
+
+    # random reactions converting one or two substrates to as many products,
+    # so that no reaction creates mass and growth is limited by the feed
+    for i in range(nReactions - nFixed):
+        chosen = random.choice(nInternal, 4, replace=False)
+        nSubstrates = random.randint(1, 3)
+        stoichiometry = {internal[m]: -1 for m in chosen[:nSubstrates]}
+        stoichiometry.update({internal[m]: 1 for m in chosen[2:2 + nSubstrates]})
+        reactions.append(internalReaction('R' + str(i), stoichiometry))
+
+    # biomass from metabolites in and outside of the core
+    coreMetabolites = coreSize - 2
+    precursors = set(random.choice(coreMetabolites,
+        min(5, coreMetabolites), replace=False))
+    precursors.update(random.choice(nInternal, min(5, nInternal), replace=False))
+    biomass = cobra.Reaction('BIOMASS', lower_bound=0, upper_bound=1000)
+    biomass.add_metabolites(
+        {internal[m]: -0.05 * random.randint(1, 4) for m in sorted(precursors)})
+    reactions.append(biomass)
+    core.add(biomass.id)
+
+    model.add_reactions(reactions)
+    model.objective = 'BIOMASS'
+
+    # require growth, which is always feasible through the tree
+    biomass.lower_bound = growthFraction * model.slim_optimize()
+
+    return model, feedExchange.id, core, {m.id for m in currency}
@@ -0,0 +1,98 @@
+"""
+Low overhead per-phase timers for profiling lftc on production models
+
+By Tyler W. H. Backman
+"""
+
+import time
+import pandas as pd
+
+
+class _Phase(object):
+    # context manager timing one named phase
+
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        timer = self.timer
+        timer.counts[self.name] = timer.counts.get(self.name, 0) + 1
+        timer.totals[self.name] = timer.totals.get(self.name, 0.0) + seconds
+        if timer.callback is not None:
+            timer.callback(self.name, seconds)
+        return False
+
+
+class _NullPhase(object):
+    # context manager which does nothing
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class PhaseTimer(object):
+
+    def __init__(self, callback=None):
+        """Counters and cumulative timers per named phase.
+
+        Use as `with timer.phase('solve'):` around each phase to time. Phases
+        may be nested, in which case the outer phase includes the inner one.
+
+        Args:
+            callback (function): Optional, called as callback(name, seconds)
+                each time a phase finishes.
+        """
+        self.callback = callback
+        self.counts = {}
+        self.totals = {}
+        self._phases = {}
+
+    def phase(self, name):
+        """Returns a context manager which times the named phase."""
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def reset(self):
+        """Clears all counters and timers."""
+        self.counts = {}
+        self.totals = {}
+
+    def asDict(self):
+        """Returns {phase: {'calls': int, 'seconds': float}}."""
+        return {name: {'calls': self.counts[name], 'seconds': self.totals[name]}
+            for name in self.totals}
+
+    def asDataFrame(self):
+        """Returns a DataFrame indexed by phase, with calls, seconds and
+        microseconds per call, sorted by total seconds."""
+        table = pd.DataFrame.from_dict(
+            self.asDict(), orient='index', columns=['calls', 'seconds'])
+        table['usPerCall'] = 1e6 * table['seconds'] / table['calls']
+        return table.sort_values('seconds', ascending=False)
+
+
+class NullTimer(PhaseTimer):
+
+    def __init__(self):
+        """A PhaseTimer which doesn't time anything, used when disabled."""
+        super(NullTimer, self).__init__()
+        self._null = _NullPhase()
+
+    def phase(self, name):
+        return self._null
@@ -0,0 +1,126 @@
+"""
+Buffered columnar recording of simulated annealing steps
+
+By Tyler W. H. Backman
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# move types, stored as their position in this tuple
+moveTypes = ('none', 'add', 'remove')
+
+traceDtype = np.dtype([
+    ('step', np.int64),
+    ('temperature', np.float64),
+    ('proposedEnergy', np.float64),
+    ('energy', np.float64),
+    ('coreSize', np.int32),
+    ('move', np.int8),
+    ('accepted', np.bool_),
+    ])
+
+
+class TraceRecorder(object):
+
+    def __init__(self, path, bufferSize=65536):
+        """Records annealing steps into a binary columnar file.
+
+        Steps are collected in a preallocated numpy buffer, and written as
+        one chunk whenever the buffer fills, on flush() and on close(). Paths
+        ending in .parquet are written as Parquet row groups (requires
+        pyarrow), all other paths as a sequence of appended .npy structured
+        arrays. Read either back with readTrace().
+
+        Args:
+            path (str): The file to write, appended to if it exists and is
+                not Parquet.
+            bufferSize (int): Optional, the number of steps held in memory
+                before writing a chunk.
+        """
+        assert bufferSize > 0
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        if self.parquet and pyarrow is None:
+            raise ImportError('pyarrow is required to write Parquet traces')
+        self._buffer = np.zeros(bufferSize, dtype=traceDtype)
+        self._size = 0
+        self._file = None
+        self._writer = None
+
+    def record(self, step, temperature, proposedEnergy, energy, coreSize,
+        move, accepted):
+        """Records one step, where move is one of lftc.trace.moveTypes."""
+        self._buffer[self._size] = (step, temperature, proposedEnergy, energy,
+            coreSize, moveTypes.index(move), accepted)
+        self._size += 1
+        if self._size == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        """Writes buffered steps to the file."""
+        if self._size == 0:
+            return
+        chunk = self._buffer[:self._size]
+        if self.parquet:
+            table = pyarrow.Table.from_pandas(
+                pd.DataFrame(chunk), preserve_index=False)
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(
+                    self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            np.save(self._file, chunk)
+            self._file.flush()
+        self._size = 0
+
+    def close(self):
+        """Writes buffered steps and closes the file."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def readTrace(path):
+    """Reads a trace written by TraceRecorder.
+
+    Args:
+        path (str): The trace file.
+
+    Returns:
+        trace (pandas.core.frame.DataFrame): One row per recorded step, with
+            columns step, temperature, proposedEnergy, energy, coreSize,
+            move (as a categorical of lftc.trace.moveTypes) and accepted.
+    """
+    if path.endswith('.parquet'):
+        trace = pd.read_parquet(path)
+    else:
+        chunks = []
+        size = os.path.getsize(path)
+        with open(path, 'rb') as fh:
+            while fh.tell() < size:
+                chunks.append(np.load(fh))
+        trace = pd.DataFrame(np.concatenate(chunks) if chunks
+            else np.zeros(0, dtype=traceDtype))
+    trace['move'] = pd.Categorical.from_codes(trace['move'], moveTypes)
+    return trace
@@ -10,7 +10,7 @@ setup(
     author_email='tbackman@lbl.gov',
     url='https://github.com/JBEI/limitfluxtocore',
     packages=['lftc'],
-    install_requires=['cobra', 'numpy'],
+    install_requires=['cobra', 'numpy', 'scipy'],
     license='see license.txt file',
     download_url = 'https://github.com/JBEI/limitfluxtocore/archive/1.0.tar.gz', 
     keywords = ['metabolism', 'flux'],
@@ -0,0 +1,18 @@
+import pytest
+import cobra
+import cobra.io
+
+@pytest.fixture
+def textbookModel():
+    # the E. coli core model, constrained to grow on glucose
+    model = cobra.io.load_model('textbook')
+    model.reactions.EX_glc__D_e.bounds = (-10, -10)
+    model.reactions.Biomass_Ecoli_core.lower_bound = 0.5
+    return model
+
+@pytest.fixture
+def startCore():
+    # glycolysis and the TCA cycle
+    return {'EX_glc__D_e', 'GLCpts', 'PGI', 'PFK', 'FBA', 'TPI', 'GAPD',
+            'PGK', 'PGM', 'ENO', 'PYK', 'PDH', 'CS', 'ACONTa', 'ACONTb',
+            'ICDHyr', 'AKGDH', 'SUCOAS', 'SUCDi', 'FUM', 'MDH'}
@@ -0,0 +1,338 @@
+import os
+import numpy as np
+import pytest
+import lftc
+
+def makeProblem(model, core):
+    return lftc.OptimalCoreProblem(
+        state=set(core),
+        model=model,
+        feed='EX_glc__D_e',
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.6,
+        excludeReactions={r.id for r in model.exchanges},
+        )
+
+def test_annealIsReproducible(textbookModel, startCore):
+    results = []
+    for repeat in range(2):
+        ocp = makeProblem(textbookModel, startCore)
+        ocp.set_schedule({'steps': 100, 'tmax': 50, 'tmin': 0.01, 'updates': 0})
+        results.append(ocp.anneal(seed=3))
+
+    (bestState, bestEnergy), (otherState, otherEnergy) = results
+    assert type(bestState) is lftc.CoreState
+    assert bestState == otherState and bestEnergy == otherEnergy
+    assert startCore.issubset(bestState.toSet())
+    assert bestEnergy == pytest.approx(
+        lftc.limitFluxToCore(bestState, textbookModel)[0], abs=1e-9)
+
+def test_annealChainsMatchesInProcess(textbookModel, startCore):
+    results = [lftc.annealChains(
+        startCore,
+        textbookModel,
+        'EX_glc__D_e',
+        {'steps': 60, 'tmax': 50, 'tmin': 0.01},
+        seeds=[1, 2, 3],
+        processes=processes,
+        exchangeSteps=20,
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.6,
+        excludeReactions={r.id for r in textbookModel.exchanges},
+        ) for processes in (1, 2)]
+
+    assert len(results[0]) == 3
+    for (state, energy), (otherState, otherEnergy) in zip(*results):
+        assert state == otherState
+        assert energy == pytest.approx(otherEnergy, abs=1e-9)
+    for state, energy in results[0]:
+        assert type(state) is set and startCore.issubset(state)
+
+def test_phaseTimings(textbookModel, startCore):
+    finished = []
+    timer = lftc.PhaseTimer(callback=lambda name, seconds: finished.append(name))
+    ocp = lftc.OptimalCoreProblem(
+        state=set(startCore),
+        model=textbookModel,
+        feed='EX_glc__D_e',
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.6,
+        timer=timer,
+        )
+    ocp.set_schedule({'steps': 20, 'tmax': 50, 'tmin': 0.01, 'updates': 0})
+    ocp.anneal(seed=1)
+
+    timings = ocp.timings()
+    for phase in ('move', 'energy', 'copy_state', 'solve', 'extract'):
+        assert timings.loc[phase, 'calls'] > 0
+    assert timings.loc['move', 'calls'] == 20
+    assert len(finished) == timings['calls'].sum()
+
+@pytest.mark.parametrize('traceName', ['trace.npy', 'trace.parquet'])
+def test_traceRecordsLoopValues(textbookModel, startCore, tmpdir, traceName):
+    if traceName.endswith('.parquet'):
+        pytest.importorskip('pyarrow')
+    traceFile = str(tmpdir.join(traceName))
+    logFile = str(tmpdir.join('log.csv'))
+    ocp = lftc.OptimalCoreProblem(
+        state=set(startCore),
+        model=textbookModel,
+        feed='EX_glc__D_e',
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.6,
+        logFile=logFile,
+        trace=lftc.TraceRecorder(traceFile, bufferSize=7),
+        )
+    ocp.set_schedule({'steps': 30, 'tmax': 50, 'tmin': 0.01, 'updates': 0})
+    bestState, bestEnergy = ocp.anneal(seed=2)
+    ocp.logFile.close()
+    ocp.trace.close()
+
+    trace = lftc.readTrace(traceFile)
+    assert list(trace.step) == list(range(31))
+    assert trace.energy.min() == pytest.approx(bestEnergy)
+    accepted = trace[trace.accepted]
+    assert (accepted.energy == accepted.proposedEnergy).all()
+    assert set(trace.move[1:]).issubset({'add', 'remove', 'none'})
+    with open(logFile) as fh:
+        assert len(fh.readlines()) == 32
+
+def test_resumeFromCheckpoint(textbookModel, startCore, tmpdir):
+    schedule = {'steps': 60, 'tmax': 50, 'tmin': 0.01, 'updates': 0}
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    expectedState, expectedEnergy = ocp.anneal(seed=4)
+
+    # kill a checkpointed run part way through
+    checkpoint = str(tmpdir.join('anneal.checkpoint'))
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_checkpoint(checkpoint, steps=20)
+    def killAt35(step, *args):
+        if step == 35:
+            raise KeyboardInterrupt
+    ocp.record_step = killAt35
+    with pytest.raises(KeyboardInterrupt):
+        ocp.anneal(seed=4)
+
+    # checkpoints only resume the problem they were written for
+    other = makeProblem(textbookModel, startCore.union({'G6PDH2r'}))
+    with pytest.raises(AssertionError):
+        other.anneal(resume=checkpoint)
+
+    # resume in a new problem, which continues the same trajectory
+    ocp = makeProblem(textbookModel, startCore)
+    bestState, bestEnergy = ocp.anneal(resume=checkpoint)
+    assert ocp.steps == 60
+    assert bestState == expectedState
+    assert bestEnergy == pytest.approx(expectedEnergy, abs=1e-9)
+
+def test_annealIter(textbookModel, startCore, tmpdir):
+    schedule = {'steps': 45, 'tmax': 50, 'tmin': 0.01, 'updates': 0}
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    expectedState, expectedEnergy = ocp.anneal(seed=4)
+
+    # snapshots follow the same trajectory, and their diffs rebuild it
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    core = set(startCore)
+    snapshots = list(ocp.anneal_iter(seed=4, every=10))
+    assert [s.step for s in snapshots] == [0, 10, 20, 30, 40, 45]
+    assert snapshots[0].acceptance is None
+    for snapshot in snapshots[1:]:
+        added, removed = snapshot.diff
+        core = core.union(added).difference(removed)
+        assert 0 <= snapshot.acceptance <= 1
+        assert snapshot.best_energy >= expectedEnergy
+    assert snapshots[-1].best_energy == expectedEnergy
+    assert ocp.best_state == expectedState and ocp.state == expectedState
+    assert snapshots[-1].energy == pytest.approx(
+        lftc.limitFluxToCore(core, textbookModel)[0], abs=1e-9)
+
+    # stopping from outside checkpoints the run so it can be resumed
+    checkpoint = str(tmpdir.join('anneal.checkpoint'))
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_checkpoint(checkpoint)
+    for snapshot in ocp.anneal_iter(seed=4, every=5):
+        if snapshot.step == 25:
+            break
+    assert ocp.state == ocp.best_state
+    ocp = makeProblem(textbookModel, startCore)
+    bestState, bestEnergy = ocp.anneal(resume=checkpoint)
+    assert bestState == expectedState
+    assert bestEnergy == pytest.approx(expectedEnergy, abs=1e-9)
+
+def test_earlyStopping(textbookModel, startCore, tmpdir):
+    schedule = {'steps': 200, 'tmax': 50, 'tmin': 0.01, 'updates': 0}
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    snapshots = list(ocp.anneal_iter(seed=4, every=None))
+    assert ocp.stop_reason == 'steps'
+    assert snapshots[-1].stop_reason == 'steps'
+    fullEnergy = ocp.best_energy
+
+    # with patience, stop once the best energy stops improving, following
+    # the same trajectory up to that point
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_stopping(patience_steps=20)
+    snapshots = list(ocp.anneal_iter(seed=4, every=1))
+    stopStep = snapshots[-1].step
+    assert ocp.stop_reason == 'patience_steps' and stopStep < 200
+    assert snapshots[-1].stop_reason == 'patience_steps'
+    lastImprovement = max([0] + [s.step for s, previous in
+        zip(snapshots[1:], snapshots) if s.best_energy < previous.best_energy])
+    assert stopStep - lastImprovement == 20
+    assert snapshots[-1].best_energy >= fullEnergy
+
+    # stop as soon as a target energy is reached
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_stopping(target_energy=float('inf'))
+    bestState, bestEnergy = ocp.anneal(seed=4)
+    assert ocp.stop_reason == 'target_energy'
+    assert bestState == set(startCore)
+
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_stopping(min_acceptance=1.0, acceptance_window=5)
+    ocp.anneal(seed=4)
+    assert ocp.stop_reason == 'min_acceptance'
+
+    # a resumed run keeps its acceptance window, so it stops at the same step
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_stopping(min_acceptance=0.8, acceptance_window=20)
+    stopStep = list(ocp.anneal_iter(seed=4, every=None))[-1].step
+    assert ocp.stop_reason == 'min_acceptance' and stopStep < 200
+    checkpoint = str(tmpdir.join('anneal.checkpoint'))
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule(schedule)
+    ocp.set_stopping(min_acceptance=0.8, acceptance_window=20)
+    ocp.set_checkpoint(checkpoint)
+    for snapshot in ocp.anneal_iter(seed=4, every=1):
+        if snapshot.step == stopStep - 5:
+            break
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_stopping(min_acceptance=0.8, acceptance_window=20)
+    snapshots = list(ocp.anneal_iter(resume=checkpoint, every=None))
+    assert ocp.stop_reason == 'min_acceptance'
+    assert snapshots[-1].step == stopStep
+
+def test_moveCandidates(textbookModel, startCore):
+    # move() only makes moves listed by moveCandidates(), near both limits
+    ocp = lftc.OptimalCoreProblem(
+        state=set(startCore),
+        model=textbookModel,
+        feed='EX_glc__D_e',
+        minOverlapWithStart=0.9,
+        maxOverlapWithModel=0.3,
+        )
+    np.random.seed(1)
+    for _ in range(100):
+        state = ocp.state.copy()
+        additions, removals = ocp.moveCandidates()
+        ocp.move()
+        assert set(np.flatnonzero(ocp.state.mask & ~state.mask)) <= \
+            set(additions)
+        assert set(np.flatnonzero(state.mask & ~ocp.state.mask)) <= \
+            set(removals)
+
+def test_localSearch(textbookModel, startCore):
+    results = []
+    for processes in (1, 2):
+        ocp = makeProblem(textbookModel, startCore)
+        startEnergy = ocp.energy()
+        results.append(lftc.localSearch(ocp, processes=processes))
+    (bestState, bestEnergy), (otherState, otherEnergy) = results
+    assert bestState == otherState and bestEnergy == otherEnergy
+    assert bestEnergy <= startEnergy
+    assert startCore.issubset(bestState.toSet())
+    assert ocp.state == bestState
+    assert ocp.findConnected(bestState) == bestState.toSet()
+    assert bestEnergy == pytest.approx(
+        lftc.limitFluxToCore(bestState, textbookModel)[0], abs=1e-9)
+
+    # no single move improves the result
+    additions, removals = ocp.moveCandidates()
+    for reactionIndex in additions:
+        assert lftc.limitFluxToCore(bestState.union(
+            {ocp.engine.index.reactionIds[reactionIndex]}),
+            textbookModel)[0] >= bestEnergy - 1e-6
+
+    # polish an annealing result
+    ocp = makeProblem(textbookModel, startCore)
+    ocp.set_schedule({'steps': 30, 'tmax': 50, 'tmin': 0.01, 'updates': 0})
+    annealedState, annealedEnergy = ocp.anneal(seed=1)
+    polishedState, polishedEnergy = lftc.localSearch(ocp, maxSteps=5)
+    assert polishedEnergy <= annealedEnergy
+
+def test_pruneBatch(textbookModel, startCore):
+    ocp = makeProblem(textbookModel, startCore)
+    added = [startCore.union({'G6PDH2r', 'PGL', 'GND'}),
+             startCore.union({'ME1', 'PPCK', 'G6PDH2r'})]
+    results = [lftc.pruneBatch(ocp, added, processes=processes)
+        for processes in (1, 2)]
+    assert results[0] == results[1]
+
+    for core, (state, energy) in zip(added, results[0]):
+        assert startCore.issubset(state.toSet())
+        assert state.toSet().issubset(core)
+        assert energy <= lftc.limitFluxToCore(core, textbookModel)[0] + 1e-9
+        assert energy == pytest.approx(
+            lftc.limitFluxToCore(state, textbookModel)[0], abs=1e-9)
+
+        # no remaining new reaction can be removed without increasing energy
+        ocp.state = state.copy()
+        removable = ocp.findRemovable(state)
+        for reaction in state.difference(startCore):
+            if removable[ocp.engine.index.reactionIndex[reaction]]:
+                assert lftc.limitFluxToCore(state.difference({reaction}),
+                    textbookModel)[0] > energy + 1e-9
+
+    # the default prunes the problem state like prune()
+    ocp.state = lftc.CoreState.fromSet(added[0], ocp.engine.index)
+    [(state, energy)] = lftc.pruneBatch(ocp)
+    assert ocp.state == state
+    ocp.state = lftc.CoreState.fromSet(added[0], ocp.engine.index)
+    ocp.prune()
+    assert ocp.energy() <= \
+        lftc.limitFluxToCore(added[0], textbookModel)[0] + 1e-9
+
+def test_estimateSchedule(textbookModel, startCore, tmpdir):
+    ocp = makeProblem(textbookModel, startCore)
+    state = ocp.state.copy()
+    schedules = [lftc.estimateSchedule(ocp, 0.5, samples=50, seed=1,
+        processes=processes) for processes in (1, 2)]
+    assert ocp.state == state
+    for schedule in schedules:
+        assert set(schedule) == {'tmax', 'tmin', 'steps', 'updates'}
+        assert schedule['tmax'] >= schedule['tmin'] > 0
+        assert schedule['steps'] > 0
+    assert schedules[0]['tmax'] == schedules[1]['tmax']
+    assert schedules[0]['tmin'] == schedules[1]['tmin']
+
+    # repeat runs read the schedule back from the cache
+    cacheDir = str(tmpdir.join('schedules'))
+    schedule = lftc.estimateSchedule(
+        ocp, 0.5, samples=50, seed=1, cacheDir=cacheDir)
+    other = makeProblem(textbookModel, startCore)
+    assert other.fingerprint() == ocp.fingerprint()
+    other.move = None
+    assert lftc.estimateSchedule(
+        other, 0.5, samples=50, seed=1, cacheDir=cacheDir) == schedule
+
+    different = makeProblem(textbookModel, startCore.union({'G6PDH2r'}))
+    assert different.fingerprint() != ocp.fingerprint()
+
+    # moves are sampled from the current state, not the start
+    moved = makeProblem(textbookModel, startCore)
+    moved.state.add('G6PDH2r')
+    assert moved.fingerprint() == ocp.fingerprint()
+    sampled = lftc.estimateSchedule(
+        moved, 0.5, samples=50, seed=1, cacheDir=cacheDir)
+    assert len(os.listdir(cacheDir)) == 2
+    assert lftc.estimateSchedule(
+        moved, 0.5, samples=50, seed=1, cacheDir=cacheDir) == sampled
@@ -0,0 +1,73 @@
+import multiprocessing
+import pytest
+import pandas as pd
+import lftc
+from lftc.cache import CoreEnergyCache
+from lftc.engine import CoreFluxResult
+
+def test_coreEnergyCache():
+    cache = CoreEnergyCache()
+    key = cache.key({'A', 'B'})
+    assert cache.get(key) is None
+    result = (1.0, pd.Series({'C': 1.0}), pd.Series({'D': -1.0}))
+    cache.put(key, result)
+    assert cache.get(cache.key(['B', 'A'])) is result
+    assert cache.hits == 1 and cache.misses == 1
+
+    # shrink the cap so only one entry fits, and confirm LRU eviction
+    cache.maxBytes = cache.currentBytes
+    cache.put(cache.key({'A'}), result)
+    assert cache.get(key) is None
+    assert cache.get(cache.key({'A'})) is result
+    assert cache.info()['evictions'] == 1
+
+def test_diskResultCache(textbookModel, startCore, tmpdir):
+    path = str(tmpdir.join('results.sqlite'))
+    cache = lftc.DiskResultCache(path)
+    expected = lftc.limitFluxToCore(startCore, textbookModel)
+    result = lftc.limitFluxToCore(startCore, textbookModel, cache=cache)
+    assert cache.info()['misses'] == 1 and cache.info()['entries'] == 1
+
+    # a new cache on the same file skips the solve
+    cache = lftc.DiskResultCache(path)
+    cached = lftc.limitFluxToCore(startCore, textbookModel, cache=cache)
+    assert cache.hits == 1
+    assert cached[0] == result[0] == pytest.approx(expected[0])
+    assert cached[1].equals(result[1]) and cached[2].equals(result[2])
+    compact = lftc.limitFluxToCore(
+        startCore, textbookModel, compact=True, cache=cache)
+    assert type(compact) is CoreFluxResult
+
+    # changed bounds or currency metabolites are a different key
+    model = textbookModel.copy()
+    model.reactions.EX_glc__D_e.bounds = (-8, -8)
+    lftc.limitFluxToCore(startCore, model, cache=cache)
+    lftc.limitFluxToCore(startCore, textbookModel,
+        lftc.currencyMetabolites.union({'pyr_c'}), cache=cache)
+    assert cache.misses == 2 and cache.info()['entries'] == 3
+
+    # least recently used results are evicted
+    cache.maxBytes = cache.info()['bytes'] - 1
+    lftc.limitFluxToCore(startCore.union({'G6PDH2r'}), textbookModel,
+        cache=cache)
+    assert cache.info()['bytes'] <= cache.maxBytes
+    lftc.limitFluxToCore(startCore, textbookModel,
+        lftc.currencyMetabolites.union({'pyr_c'}), cache=cache)
+    assert cache.hits == 3
+    lftc.limitFluxToCore(startCore, textbookModel, cache=cache)
+    assert cache.misses == 4
+
+def _cachedFlux(args):
+    # score a core from a worker process through a shared disk cache
+    cache, model, core = args
+    return lftc.limitFluxToCore(core, model, cache=cache)[0]
+
+def test_diskResultCacheAcrossProcesses(textbookModel, startCore, tmpdir):
+    cache = lftc.DiskResultCache(str(tmpdir.join('results.sqlite')))
+    cores = [startCore, startCore.union({'G6PDH2r'}), startCore] * 4
+    with multiprocessing.Pool(4) as pool:
+        fluxes = pool.map(_cachedFlux,
+            [(cache, textbookModel, core) for core in cores])
+    assert fluxes == pytest.approx([lftc.limitFluxToCore(
+        core, textbookModel)[0] for core in cores], abs=1e-9)
+    assert cache.info()['entries'] == 2
@@ -0,0 +1,54 @@
+import pickle
+import numpy as np
+import pytest
+import lftc
+
+def test_compactModelRoundTrip(textbookModel, tmp_path):
+    path = str(tmp_path / 'textbook')
+    saved = lftc.saveCompactModel(textbookModel, path)
+    model = lftc.loadCompactModel(path)
+
+    assert model.reactionIds == [r.id for r in textbookModel.reactions]
+    assert np.array_equal(model.bounds, saved.bounds)
+    assert 'EX_glc__D_e' in model.exchangeIds
+    for name in ('stoichiometry', 'adjacency', 'adjacencyT', 'reactantsT'):
+        assert (getattr(model.index, name) !=
+            getattr(saved.index, name)).nnz == 0
+
+    # loaded models are pickled as their path
+    assert len(pickle.dumps(model)) < 1000
+    assert pickle.loads(pickle.dumps(model)).reactionIds == model.reactionIds
+
+def test_compactModelScoresCores(textbookModel, startCore, tmp_path):
+    path = str(tmp_path / 'textbook')
+    lftc.saveCompactModel(textbookModel, path)
+    model = lftc.loadCompactModel(path)
+
+    cores = [startCore, startCore.union({'G6PDH2r'}),
+             startCore.difference({'MDH'})]
+    for core in cores:
+        fluxIntoCore, producingFluxes, consumingFluxes = \
+            lftc.limitFluxToCore(core, model)
+        expected = lftc.limitFluxToCore(core, textbookModel)
+        assert fluxIntoCore == pytest.approx(expected[0], abs=1e-6)
+        assert list(producingFluxes.index) == list(expected[1].index)
+
+    # one matrix engine is kept and reused by every call
+    assert len(model._engines) == 1
+
+    with pytest.raises(AssertionError):
+        lftc.limitFluxToCore(startCore, model, backend='cobra')
+
+    # workers load the model from its path
+    table = lftc.limitFluxToCoreBatch(cores, path, processes=2, chunksize=1)
+    for i, core in enumerate(cores):
+        rows = table[table.core == i]
+        assert rows.fluxIntoCore.iloc[0] == pytest.approx(
+            lftc.limitFluxToCore(core, textbookModel)[0], abs=1e-6)
+
+    problem = lftc.OptimalCoreProblem(startCore, model, 'EX_glc__D_e')
+    problem.set_schedule({'tmax': 1.0, 'tmin': 0.01, 'steps': 20,
+                          'updates': 0})
+    state, energy = problem.anneal(seed=1)
+    assert energy == pytest.approx(
+        lftc.limitFluxToCore(state.toSet(), textbookModel)[0], abs=1e-6)
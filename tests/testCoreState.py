@@ -0,0 +1,26 @@
+import pickle
+import cobra
+import cobra.io
+import lftc
+from lftc.modelIndex import ModelIndex
+
+def test_coreStateBehavesLikeSet():
+    model = cobra.io.load_model('textbook')
+    index = ModelIndex.fromModel(model)
+    names = {'PGI', 'PFK', 'FBA'}
+    state = lftc.CoreState.fromSet(names, index)
+
+    assert state == names and len(state) == 3 and 'PGI' in state
+    copied = state.copy()
+    copied.add('TPI')
+    copied.remove('PGI')
+    assert 'PGI' in state and 'TPI' not in state
+    assert copied.toSet() == {'PFK', 'FBA', 'TPI'}
+    assert copied.key() != state.key()
+    copied.add('PGI')
+    copied.discard('TPI')
+    assert copied.key() == state.key() and copied == state
+
+    restored = pickle.loads(pickle.dumps(state))
+    assert restored == names and restored.key() == state.key()
+    assert list(restored) == [r.id for r in model.reactions if r.id in names]
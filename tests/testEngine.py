@@ -0,0 +1,198 @@
+import cobra
+from cobra.exceptions import OptimizationError
+import numpy as np
+import pandas as pd
+import pytest
+import lftc
+from lftc.engine import CoreFluxEngine
+
+def test_engineMatchesColdSolve(textbookModel, startCore):
+    model = textbookModel
+    engine = CoreFluxEngine(model.copy(), lftc.currencyMetabolites)
+
+    cores = [set(startCore), startCore.union({'G6PDH2r', 'PGL', 'GND'}),
+             startCore.union({'G6PDH2r'}), set(startCore),
+             startCore.difference({'MDH'})]
+    for core in cores:
+        fluxIntoCore, producingFluxes, consumingFluxes = engine.evaluate(core)
+        expected = lftc.limitFluxToCore(core, model)
+        assert fluxIntoCore == pytest.approx(expected[0], abs=1e-9)
+        assert list(producingFluxes.index) == list(expected[1].index)
+        assert list(consumingFluxes.index) == list(expected[2].index)
+        assert (producingFluxes >= 0).all()
+        assert (consumingFluxes <= 0).all()
+
+def test_limitFluxToCoreBatch(textbookModel, startCore):
+    cores = [startCore, startCore.union({'G6PDH2r'}),
+             startCore.difference({'MDH'})]
+    for processes in (1, 2):
+        table = lftc.limitFluxToCoreBatch(
+            cores, textbookModel, processes=processes, chunksize=1)
+        for i, core in enumerate(cores):
+            fluxIntoCore, producingFluxes, consumingFluxes = \
+                lftc.limitFluxToCore(core, textbookModel)
+            rows = table[table.core == i]
+            assert rows.fluxIntoCore.iloc[0] == \
+                pytest.approx(fluxIntoCore, abs=1e-9)
+            producing = rows[rows.boundary == 'producing']
+            assert list(producing.reaction) == list(producingFluxes.index)
+            assert len(rows) == len(producingFluxes) + len(consumingFluxes)
+
+@pytest.mark.parametrize('backend', ['cobra', 'matrix'])
+def test_infeasibleModelRaises(textbookModel, startCore, backend):
+    textbookModel.reactions.Biomass_Ecoli_core.lower_bound = 100
+    with pytest.raises(OptimizationError):
+        lftc.limitFluxToCore(startCore, textbookModel, backend=backend)
+
+def test_interleavedInProcessStreams(textbookModel, startCore):
+    # streams run in this process each keep their own engine
+    other = textbookModel.copy()
+    other.reactions.EX_glc__D_e.bounds = (-4, -4)
+    other.reactions.Biomass_Ecoli_core.lower_bound = 0.1
+    expected = [lftc.limitFluxToCore(startCore, model)[0]
+        for model in (textbookModel, other)]
+    assert expected[0] != pytest.approx(expected[1], abs=1e-6)
+
+    first = lftc.iterLimitFluxToCore([startCore] * 2, textbookModel)
+    second = lftc.iterLimitFluxToCore([startCore] * 2, other)
+    for a, b in zip(first, second):
+        assert a[1] == pytest.approx(expected[0], abs=1e-9)
+        assert b[1] == pytest.approx(expected[1], abs=1e-9)
+
+    # a sweep in this process leaves an open stream untouched
+    stream = lftc.iterLimitFluxToCore([startCore] * 2, textbookModel)
+    assert next(stream)[1] == pytest.approx(expected[0], abs=1e-9)
+    conditions = pd.DataFrame({'condition': ['low'],
+        'reaction': ['EX_glc__D_e'], 'lower': [-4], 'upper': [-4]})
+    lftc.limitFluxToCoreSweep(startCore, textbookModel, conditions)
+    assert next(stream)[1] == pytest.approx(expected[0], abs=1e-9)
+
+def test_compactResult(textbookModel, startCore):
+    result = lftc.limitFluxToCore(startCore, textbookModel, compact=True)
+    fluxIntoCore, producingFluxes, consumingFluxes = \
+        lftc.limitFluxToCore(startCore, textbookModel)
+
+    assert result.fluxIntoCore == pytest.approx(fluxIntoCore, abs=1e-9)
+    assert list(result.producingFluxes.index) == list(producingFluxes.index)
+    assert (result.producingValues >= 0).all()
+    assert (result.consumingValues <= 0).all()
+    assert result.fluxIntoCore == pytest.approx(
+        result.producingValues.sum() - result.consumingValues.sum())
+    unpacked = tuple(result)
+    assert unpacked[2].equals(result.consumingFluxes)
+
+def test_setModelFluxes(textbookModel, startCore):
+    fluxIntoCore, producingFluxes, consumingFluxes = \
+        lftc.limitFluxToCore(startCore, textbookModel)
+    newModel = lftc.setModelFluxes(
+        textbookModel, producingFluxes, consumingFluxes)
+    for reactionName, fluxLimit in producingFluxes.items():
+        assert newModel.reactions.get_by_id(reactionName).upper_bound == \
+            fluxLimit
+    for reactionName, fluxLimit in consumingFluxes.items():
+        assert newModel.reactions.get_by_id(reactionName).lower_bound == \
+            fluxLimit
+    assert newModel.slim_optimize() >= 0.5 - 1e-6
+
+def test_modelTransaction(textbookModel, startCore):
+    model = textbookModel
+    objective = str(model.objective.expression)
+    growth = model.slim_optimize()
+    bounds = [r.bounds for r in model.reactions]
+
+    # limitFluxToCore rolls back its objective instead of copying the model
+    fluxIntoCore, producingFluxes, consumingFluxes = \
+        lftc.limitFluxToCore(startCore, model)
+    assert str(model.objective.expression) == objective
+    assert model.objective.direction == 'max'
+    assert model.slim_optimize() == pytest.approx(growth)
+
+    with lftc.modelTransaction(model):
+        bounded = lftc.setModelFluxes(
+            model, producingFluxes, consumingFluxes, copyModel=False)
+        assert bounded is model
+        for reactionName, fluxLimit in producingFluxes.items():
+            assert model.reactions.get_by_id(reactionName).upper_bound == \
+                fluxLimit
+        assert model.slim_optimize() >= 0.5 - 1e-6
+    assert [r.bounds for r in model.reactions] == bounds
+    assert model.slim_optimize() == pytest.approx(growth)
+
+    # presolve is restored however the objective is handled
+    model.solver.configuration.presolve = True
+    for copyModel in (True, False):
+        lftc.limitFluxToCore(startCore, model, copyModel=copyModel)
+        assert model.solver.configuration.presolve is True
+
+def test_matrixBackendMatchesCobra(textbookModel, startCore):
+    cores = [set(startCore), startCore.union({'G6PDH2r', 'PGL', 'GND'}),
+             startCore.difference({'MDH'})]
+    for core in cores:
+        fluxIntoCore, producingFluxes, consumingFluxes = \
+            lftc.limitFluxToCore(core, textbookModel, backend='matrix')
+        expected = lftc.limitFluxToCore(core, textbookModel)
+        assert fluxIntoCore == pytest.approx(expected[0], abs=1e-6)
+        assert list(producingFluxes.index) == list(expected[1].index)
+        assert list(consumingFluxes.index) == list(expected[2].index)
+        assert (producingFluxes >= 0).all()
+        assert (consumingFluxes <= 0).all()
+
+    model, feed, core, currency = lftc.makeSyntheticModel(
+        nReactions=300, nMetabolites=200, nCurrency=10, coreSize=30, seed=3)
+    assert lftc.limitFluxToCore(core, model, currency, backend='matrix')[0] \
+        == pytest.approx(lftc.limitFluxToCore(core, model, currency)[0],
+            abs=1e-6)
+
+    ocp = lftc.OptimalCoreProblem(
+        state=set(startCore),
+        model=textbookModel,
+        feed='EX_glc__D_e',
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.5,
+        backend='matrix',
+        )
+    ocp.set_schedule({'steps': 30, 'tmax': 5, 'tmin': 0.01, 'updates': 0})
+    bestState, bestEnergy = ocp.anneal(seed=1)
+    assert bestEnergy == pytest.approx(
+        lftc.limitFluxToCore(bestState.toSet(), textbookModel)[0], abs=1e-6)
+
+def test_limitFluxToCoreSweep(textbookModel, startCore):
+    conditions = pd.DataFrame({
+        'condition': ['low', 'low', 'high', 'reversible', 'infeasible'],
+        'reaction': ['EX_glc__D_e', 'Biomass_Ecoli_core', 'EX_glc__D_e',
+                     'EX_glc__D_e', 'EX_glc__D_e'],
+        'lower': [-5, 0.2, -20, -10, 0],
+        'upper': [-5, np.nan, -20, 1000, 0],
+        })
+    expected = {}
+    for condition, rows in conditions.groupby('condition', sort=False):
+        model = textbookModel.copy()
+        for reaction, lower, upper in zip(rows.reaction, rows.lower, rows.upper):
+            reaction = model.reactions.get_by_id(reaction)
+            reaction.bounds = (lower, reaction.upper_bound if np.isnan(upper)
+                else upper)
+        try:
+            expected[condition] = lftc.limitFluxToCore(startCore, model)
+        except cobra.exceptions.OptimizationError:
+            expected[condition] = None
+
+    for backend in ('cobra', 'matrix'):
+        for processes in (1, 2):
+            results = lftc.limitFluxToCoreSweep(startCore, textbookModel,
+                conditions, processes=processes, chunksize=2, backend=backend)
+            assert results.conditions == list(expected)
+            for condition, values in expected.items():
+                if values is None:
+                    assert np.isnan(results[condition].fluxIntoCore)
+                    continue
+                result = results[condition]
+                assert result.fluxIntoCore == pytest.approx(values[0], abs=1e-6)
+                assert list(result.producingFluxes.index) == \
+                    list(values[1].index)
+                assert list(result.consumingFluxes.index) == \
+                    list(values[2].index)
+            table = results.toFrame()
+            assert set(table.condition) == {'low', 'high', 'reversible'}
+
+    # the model itself is left unchanged
+    assert textbookModel.reactions.EX_glc__D_e.bounds == (-10, -10)
@@ -0,0 +1,104 @@
+import numpy as np
+import cobra
+import cobra.io
+import lftc
+from lftc.modelIndex import ModelIndex
+from lftc.boundaryTracker import BoundaryTracker
+from lftc.exploreModel import \
+    findSubsetConnectedToFeed, \
+    findConsumedMetabolites, \
+    findProducingReactionsOutsideCore, \
+    findReversibleConsumingReactionsOutsideCore, \
+    findSubsetConnectedToFeedIndexed, \
+    findConsumedMetabolitesIndexed, \
+    findProducingReactionsOutsideCoreIndexed, \
+    findReversibleConsumingReactionsOutsideCoreIndexed, \
+    findRemovableReactionsIndexed
+
+def test_indexedMatchesModelWalk():
+    model = cobra.io.load_model('textbook')
+    currency = lftc.currencyMetabolites
+    index = ModelIndex.fromModel(model, currency)
+    feed = 'EX_glc__D_e'
+
+    # a connected core, plus reactions which aren't connected to the feed
+    core = {'GLCpts', 'PGI', 'PFK', 'FBA', 'TPI', 'GAPD', 'PGK', 'PGM',
+            'ENO', 'PYK', 'PDH', 'CS', 'ACONTa', 'ACONTb', 'ICDHyr',
+            'EX_ac_e', 'NH4t'}
+    coreMask = index.reactionMask(core)
+
+    metabolites = findConsumedMetabolites(core, model, currency)
+    metaboliteMask = findConsumedMetabolitesIndexed(coreMask, index)
+    assert index.metaboliteNames(metaboliteMask) == metabolites
+
+    assert index.reactionNames(findProducingReactionsOutsideCoreIndexed(
+        metaboliteMask, index, coreMask)) == \
+        findProducingReactionsOutsideCore(metabolites, model, core)
+    assert index.reactionNames(
+        findReversibleConsumingReactionsOutsideCoreIndexed(
+            metaboliteMask, index, coreMask)) == \
+        findReversibleConsumingReactionsOutsideCore(metabolites, model, core)
+
+    connected = findSubsetConnectedToFeed(core, feed, currency, model)
+    assert index.reactionNames(findSubsetConnectedToFeedIndexed(
+        coreMask, index.reactionIndex[feed], index)) == connected
+    assert 'EX_ac_e' not in connected
+
+def test_removableMatchesRepeatedSearch():
+    model = cobra.io.load_model('textbook')
+    index = ModelIndex.fromModel(model, lftc.currencyMetabolites)
+    feed = index.reactionIndex['EX_glc__D_e']
+    randomState = np.random.RandomState(0)
+
+    for trial in range(10):
+        # grow a random core outwards from the feed
+        core = np.zeros(len(index.reactionIds), dtype=bool)
+        core[feed] = True
+        for step in range(randomState.randint(5, 60)):
+            metabolites = index.adjacencyT.dot(core.astype(np.int8)) > 0
+            candidates = np.flatnonzero(
+                (index.adjacency.dot(metabolites.astype(np.int8)) > 0) & ~core)
+            core[randomState.choice(candidates)] = True
+
+        removable = findRemovableReactionsIndexed(core, feed, index)
+        for r in np.flatnonzero(core):
+            tempCore = core.copy()
+            tempCore[r] = False
+            connected = findSubsetConnectedToFeedIndexed(tempCore, feed, index)
+            expected = r != feed and connected.sum() == tempCore.sum()
+            assert removable[r] == expected
+
+def test_boundaryTrackerMatchesRecompute():
+    model = cobra.io.load_model('textbook')
+    index = ModelIndex.fromModel(model, lftc.currencyMetabolites)
+    tracker = BoundaryTracker(index)
+    randomState = np.random.RandomState(1)
+    producing = np.zeros(len(index.reactionIds), dtype=bool)
+    consuming = np.zeros(len(index.reactionIds), dtype=bool)
+
+    for step in range(200):
+        # toggle one random reaction, or jump to a random core
+        core = tracker.core.copy()
+        if step % 25 == 0:
+            core = randomState.random_sample(len(core)) < 0.3
+        else:
+            core[randomState.randint(len(core))] ^= True
+        tracker.update(core)
+
+        metaboliteMask = findConsumedMetabolitesIndexed(core, index)
+        assert (tracker.consumedMetabolites == metaboliteMask).all()
+        assert (tracker.producing == findProducingReactionsOutsideCoreIndexed(
+            metaboliteMask, index, core)).all()
+        assert (tracker.consuming ==
+            findReversibleConsumingReactionsOutsideCoreIndexed(
+                metaboliteMask, index, core)).all()
+
+        # replaying the diffs reproduces the boundary
+        addedProducing, removedProducing, addedConsuming, removedConsuming = \
+            tracker.diff()
+        producing[addedProducing] = True
+        producing[removedProducing] = False
+        consuming[addedConsuming] = True
+        consuming[removedConsuming] = False
+        assert (producing == tracker.producing).all()
+        assert (consuming == tracker.consuming).all()
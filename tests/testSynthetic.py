@@ -0,0 +1,39 @@
+import lftc
+
+def test_syntheticModelIsReproducible():
+    model, feed, core, currency = lftc.makeSyntheticModel(
+        nReactions=300, nMetabolites=200, nCurrency=10, coreSize=30, seed=5)
+    other = lftc.makeSyntheticModel(
+        nReactions=300, nMetabolites=200, nCurrency=10, coreSize=30, seed=5)[0]
+
+    assert len(model.reactions) == 300 and len(model.metabolites) == 200
+    assert len(core) == 30 and len(currency) == 10
+    assert [(r.id, r.reaction, r.bounds) for r in model.reactions] == \
+        [(r.id, r.reaction, r.bounds) for r in other.reactions]
+    different = lftc.makeSyntheticModel(
+        nReactions=300, nMetabolites=200, nCurrency=10, coreSize=30, seed=6)[0]
+    assert [r.reaction for r in model.reactions] != \
+        [r.reaction for r in different.reactions]
+
+def test_syntheticModelWorksWithLFTC():
+    model, feed, core, currency = lftc.makeSyntheticModel(
+        nReactions=300, nMetabolites=200, nCurrency=10, coreSize=30, seed=2)
+    assert model.slim_optimize() > 0
+
+    fluxIntoCore, producingFluxes, consumingFluxes = \
+        lftc.limitFluxToCore(core, model, currency)
+    assert fluxIntoCore > 0
+
+    ocp = lftc.OptimalCoreProblem(
+        state=core,
+        model=model,
+        feed=feed,
+        currencyMetabolites=currency,
+        minOverlapWithStart=1.0,
+        maxOverlapWithModel=0.5,
+        excludeReactions={r.id for r in model.exchanges},
+        )
+    assert ocp.startSet == core
+    ocp.set_schedule({'steps': 50, 'tmax': 5, 'tmin': 0.01, 'updates': 0})
+    bestState, bestEnergy = ocp.anneal(seed=1)
+    assert bestEnergy <= round(fluxIntoCore, 9)